@@ -1,16 +1,33 @@
 import os
 import shutil
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Response, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse, FileResponse
 from pydantic import BaseModel
+from typing import Optional, List
+from contextlib import ExitStack, contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import uvicorn
-from video_editor import VideoEditor
+from video_editor import VideoEditor, AUDIO_CODECS, HLS_PLAYLIST
 from vad_processor import VADProcessor
 from project_exporter import ProjectExporter
 from shotcut_exporter import ShotcutExporter
+from fcpxml_exporter import FCPXMLExporter
+from otio_exporter import OTIOExporter
+from timeline_writer import TimelineWriter, stream_timeline, MIN_FPS
+from metrics import registry, STAGE_SECONDS, QUEUE_DEPTH, ACTIVE_JOBS, JOBS_TOTAL
+from tracing import Tracer, NULL_TRACER
+from log_buffer import LogBuffer, console_handler
+from file_index import FileIndex, Evictor, Indexer, HashingWriter
+from waveform import WaveformPyramid
+from segment_store import SegmentStore, SegmentList, NPY_MEDIA_TYPE
 import uuid
-import sys
+import re
+import threading
+import time
 
 app = FastAPI()
 
@@ -21,15 +38,47 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Tile metadata for /waveform responses
+    expose_headers=["X-Waveform-Level", "X-Window-Seconds", "X-First-Window", "X-Window-Count", "X-Scale"],
 )
 
 # Ensure directories exist
 UPLOAD_DIR = "uploads"
 OUTPUT_DIR = "outputs"
 TEMP_DIR = "temp"
+WAVEFORM_DIR = "waveforms"
+SEGMENT_DIR = "segments"
+STREAM_DIR = "streams"  # Progressive HLS output, one folder per job
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 os.makedirs(TEMP_DIR, exist_ok=True)
+os.makedirs(WAVEFORM_DIR, exist_ok=True)
+os.makedirs(SEGMENT_DIR, exist_ok=True)
+os.makedirs(STREAM_DIR, exist_ok=True)
+
+# Jobs are only tracked in memory, so streams from a previous run can't be reached anymore
+for name in os.listdir(STREAM_DIR):
+    path = os.path.join(STREAM_DIR, name)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        os.remove(path)
+
+# Storage index; quota of 0 disables eviction
+FILE_INDEX_PATH = os.environ.get("CROPPA_FILE_INDEX", "file_index.db")
+STORAGE_QUOTA_BYTES = int(os.environ.get("CROPPA_STORAGE_QUOTA_BYTES", "0"))
+EVICT_INTERVAL = float(os.environ.get("CROPPA_EVICT_INTERVAL", "60"))
+file_index = FileIndex(FILE_INDEX_PATH, {
+    "upload": UPLOAD_DIR,
+    "output": OUTPUT_DIR,
+    "waveform": WAVEFORM_DIR,  # Derived: deleted with its upload
+    "segments": SEGMENT_DIR,  # Derived when the upload is known
+    "stream": STREAM_DIR,  # One folder per HLS job
+})
+# Reconcile and hash in the background so startup doesn't read every stored file
+Indexer(file_index).start()
+if STORAGE_QUOTA_BYTES > 0:
+    Evictor(file_index, STORAGE_QUOTA_BYTES, EVICT_INTERVAL).start()
 
 print("=" * 60)
 print("BACKEND VERSION: 2024-11-21-v2 (File Management Fixed)")
@@ -40,25 +89,138 @@ print("=" * 60)
 # Mount static files for outputs
 app.mount("/outputs", StaticFiles(directory=OUTPUT_DIR), name="outputs")
 
+@app.middleware("http")
+async def touch_downloaded_outputs(request, call_next):
+    """Count downloads from /outputs as an access for LRU eviction"""
+    response = await call_next(request)
+    if request.method == "GET" and request.url.path.startswith("/outputs/") and response.status_code < 400:
+        file_index.touch("output", request.url.path[len("/outputs/"):])
+    return response
+
 # Initialize processors
 vad_processor = VADProcessor()
 video_editor = VideoEditor()
 project_exporter = ProjectExporter()
 shotcut_exporter = ShotcutExporter()
+fcpxml_exporter = FCPXMLExporter()
+otio_exporter = OTIOExporter()
+timeline_exporters = {
+    "mlt": shotcut_exporter,
+    "edl": project_exporter,
+    "fcpxml": fcpxml_exporter,
+    "otio": otio_exporter,
+}
+segment_store = SegmentStore(SEGMENT_DIR)
 
 # Global progress state
 processing_progress = 0
-processing_logs = []
+# Per-job log capacity (entries); older entries are dropped first
+LOG_CAPACITY = int(os.environ.get("CROPPA_LOG_CAPACITY", "2000"))
+processing_logs = LogBuffer(LOG_CAPACITY, handler=console_handler())
+
+# Jobs run one at a time on their own thread so concurrent renders don't fight
+# over the encoder, and queued jobs don't tie up FastAPI's request threads
+processing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="croppa-job")
+
+# Recent jobs by id (oldest evicted first; unfinished jobs and pending approvals are kept)
+MAX_TRACKED_JOBS = 50
+_UNEVICTABLE_STATUSES = ("queued", "running", "awaiting_approval", "approved")
+jobs = OrderedDict()
+jobs_lock = threading.Lock()
+# Job ids double as stream folder names
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+def register_job(job_id, filename, trace=False):
+    job = {
+        "job_id": job_id,
+        "filename": filename,
+        "status": "queued",
+        "tracer": Tracer(f"croppa job {job_id}") if trace else NULL_TRACER,
+        "logs": LogBuffer(LOG_CAPACITY, handler=console_handler()),
+    }
+    with jobs_lock:
+        if job_id in jobs:
+            raise HTTPException(status_code=409, detail=f"Job '{job_id}' already exists")
+        jobs[job_id] = job
+        evicted = []
+        for old_id in list(jobs):
+            if len(jobs) <= MAX_TRACKED_JOBS:
+                break
+            if jobs[old_id]["status"] not in _UNEVICTABLE_STATUSES:
+                evicted.append(jobs.pop(old_id))
+    for old_job in evicted:
+        # A forgotten job's stream can no longer be reached
+        if "stream_dir" in old_job:
+            shutil.rmtree(stream_dir_for(old_job["job_id"]), ignore_errors=True)
+            file_index.remove("stream", old_job["job_id"])
+    return job
+
+def stream_dir_for(job_id):
+    """A job's HLS folder; never resolves outside STREAM_DIR"""
+    if not JOB_ID_PATTERN.match(job_id):
+        raise ValueError(f"Invalid job id: {job_id!r}")
+    root = os.path.realpath(STREAM_DIR)
+    path = os.path.realpath(os.path.join(root, job_id))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"Stream folder outside {STREAM_DIR}: {path}")
+    return path
 
 def update_progress_callback(percent):
     global processing_progress
     processing_progress = percent
 
-def add_log(message: str):
-    global processing_logs
-    processing_logs.append(message)
-    print(message)
-    sys.stdout.flush()
+def add_log(message: str, level: str = "info", stage: Optional[str] = None):
+    """Log to the current job's buffer; console output happens off-thread"""
+    processing_logs.add(message, level=level, stage=stage)
+
+def waveform_dir_for(filename):
+    return os.path.join(WAVEFORM_DIR, filename)
+
+def store_segments(segments, source=None, segments_id=None):
+    """Save segments and index them (as derived from `source`, if given); returns the id"""
+    segments_id = segment_store.put(segments, segments_id)
+    file_index.add("segments", segment_store.filename_for(segments_id), source=source)
+    return segments_id
+
+def load_segments(segments_id):
+    """Stored segments (counted as an access for eviction), or None"""
+    segments = segment_store.get(segments_id)
+    if segments is not None:
+        file_index.touch("segments", segment_store.filename_for(segments_id))
+    return segments
+
+@contextmanager
+def pinned_uploads(filenames):
+    """Keep the evictor away from uploads while a request reads them"""
+    for filename in filenames:
+        file_index.pin("upload", filename)
+    try:
+        yield
+    finally:
+        for filename in filenames:
+            file_index.unpin("upload", filename)
+
+def remove_derived(filename):
+    """Delete what was derived from an upload (its waveform, segments)"""
+    file_index.delete_derived(filename)
+    # Not indexed yet if the background reconcile hasn't got to it
+    path = waveform_dir_for(filename)
+    if os.path.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+class AnalyzeRequest(BaseModel):
+    filename: str
+    silence_threshold: float = -40.0
+    min_silence_duration: float = 0.5
+    padding: float = 0.25
+    include_segments: bool = True  # False: reply with segments_id only
+
+class AnalyzeBatchRequest(BaseModel):
+    filenames: List[str]
+    silence_threshold: float = -40.0
+    min_silence_duration: float = 0.5
+    padding: float = 0.25
+    include_segments: bool = True  # False: reply with segments_id only
 
 class ProcessRequest(BaseModel):
     filename: str
@@ -71,6 +233,28 @@ class ProcessRequest(BaseModel):
     video_cq: int = 19
     video_preset: str = 'p4'
     audio_bitrate: int = 192
+    # Output mode: 'video' (trimmed video) or 'audio' (trimmed audio only, no video encode)
+    # 'hls' streams batches as they finish (see /jobs/{job_id}/stream/index.m3u8)
+    output_mode: str = 'video'
+    audio_format: str = 'm4a'  # Audio mode only: 'm4a', 'opus' or 'wav'
+    # Job tracking
+    job_id: Optional[str] = None  # Generated if omitted
+    trace: bool = False  # Record a Chrome trace, served by /jobs/{job_id}/trace
+    include_segments: bool = True  # False: reply with segments_id only
+    # Preview: render a low-res proxy, then the final output on /jobs/{job_id}/approve
+    proxy: bool = False
+    proxy_height: int = 360
+
+def output_filename_for(request: ProcessRequest):
+    """Name of the file written to OUTPUT_DIR (None for HLS, which lives in STREAM_DIR)"""
+    if request.output_mode == "hls":
+        return None
+    if request.output_mode == "audio":
+        return f"processed_{os.path.splitext(request.filename)[0]}.{request.audio_format}"
+    return f"processed_{request.filename}"
+
+def proxy_filename_for(request: ProcessRequest):
+    return f"proxy_{os.path.splitext(request.filename)[0]}.mp4"
 
 @app.get("/status")
 def get_status():
@@ -81,44 +265,157 @@ async def get_progress():
     global processing_progress
     return {"progress": processing_progress}
 
+def _logs_response(buffer, since):
+    entries = buffer.entries(since)
+    return {
+        "logs": [e.message for e in entries],
+        "entries": [e.to_dict() for e in entries],
+        "dropped": buffer.dropped,
+    }
+
 @app.get("/logs")
-async def get_logs():
-    global processing_logs
-    return {"logs": processing_logs}
+async def get_logs(since: Optional[int] = None):
+    """Logs of the most recent job; pass `since` (a seq number) to poll incrementally"""
+    return _logs_response(processing_logs, since)
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "job_id": job["job_id"],
+        "filename": job["filename"],
+        "status": job["status"],
+        "trace_enabled": job["tracer"].enabled,
+        "segments_id": job.get("segments_id"),
+        "proxy_file": job.get("proxy_file"),
+    }
+
+@app.get("/jobs/{job_id}/logs")
+def get_job_logs(job_id: str, since: Optional[int] = None):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _logs_response(job["logs"], since)
+
+@app.get("/jobs/{job_id}/trace")
+def get_job_trace(job_id: str):
+    """Download the job trace in Chrome/Perfetto JSON format"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job["tracer"].enabled:
+        raise HTTPException(status_code=404, detail="Tracing was not enabled for this job")
+    return JSONResponse(
+        job["tracer"].to_chrome_trace(),
+        headers={"Content-Disposition": f'attachment; filename="trace_{job_id}.json"'},
+    )
+
+_STREAM_FILE = re.compile(r"^(index\.m3u8|seg_\d+\.ts)$")
+# A stream.ts download gives up after this long without a new segment
+STREAM_IDLE_TIMEOUT = float(os.environ.get("CROPPA_STREAM_IDLE_TIMEOUT", "600"))
+
+def _stream_dir(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if "stream_dir" not in job:
+        raise HTTPException(status_code=404, detail="This job has no stream (yet)")
+    return job, job["stream_dir"]
+
+def _playlist_segments(stream_dir):
+    """Finished segment names and whether the playlist is complete (None, False without a playlist)"""
+    try:
+        with open(os.path.join(stream_dir, HLS_PLAYLIST)) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None, False
+    return [l for l in lines if l and not l.startswith("#")], "#EXT-X-ENDLIST" in lines
+
+@app.get("/jobs/{job_id}/stream/{name}")
+def get_job_stream_file(job_id: str, name: str):
+    """HLS playlist and segments of a job rendered with output_mode='hls'"""
+    _, stream_dir = _stream_dir(job_id)
+    path = os.path.join(stream_dir, name)
+    if not _STREAM_FILE.match(name) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Stream file not found")
+    file_index.touch("stream", job_id)
+    if name == HLS_PLAYLIST:
+        # The playlist grows while the job runs
+        return FileResponse(path, media_type="application/vnd.apple.mpegurl",
+                            headers={"Cache-Control": "no-cache"})
+    return FileResponse(path, media_type="video/mp2t")
+
+@app.get("/jobs/{job_id}/stream.ts")
+def get_job_stream_download(job_id: str):
+    """The whole HLS output as one growing MPEG-TS download, sent batch by batch"""
+    job, stream_dir = _stream_dir(job_id)
+    file_index.touch("stream", job_id)
+    
+    def iter_stream():
+        sent = 0
+        last_progress = time.monotonic()
+        while True:
+            # Read before the playlist, so a finished job's playlist is read in full once more
+            active = job["status"] in ("running", "approved")
+            names, ended = _playlist_segments(stream_dir)
+            if names is None:
+                # Before the first batch the playlist may simply not exist yet;
+                # afterwards it means the stream was deleted
+                if sent or not active:
+                    return
+                names = []
+            for name in names[sent:]:
+                with open(os.path.join(stream_dir, name), "rb") as f:
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        yield chunk
+            if len(names) > sent:
+                last_progress = time.monotonic()
+            sent = len(names)
+            # Failed, or (after a failed approved render) back to awaiting_approval
+            if ended or not active:
+                return
+            if jobs.get(job_id) is not job:
+                return  # Job forgotten; its stream is being removed
+            if time.monotonic() - last_progress > STREAM_IDLE_TIMEOUT:
+                print(f"Stream download of job {job_id} idle for {STREAM_IDLE_TIMEOUT:.0f}s, giving up")
+                return
+            time.sleep(0.5)
+    
+    return StreamingResponse(iter_stream(), media_type="video/mp2t",
+                             headers={"Content-Disposition": f'attachment; filename="processed_{job_id}.ts"'})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return registry.render()
 
 @app.get("/files")
-async def list_files():
-    """List all stored files (uploads and outputs)"""
+async def list_files(offset: int = 0, limit: int = 500):
+    """List stored files (uploads and outputs) from the file index, one page per type"""
     try:
-        uploads = []
-        outputs = []
-        
-        # List upload files
-        if os.path.exists(UPLOAD_DIR):
-            for filename in os.listdir(UPLOAD_DIR):
-                filepath = os.path.join(UPLOAD_DIR, filename)
-                if os.path.isfile(filepath):
-                    uploads.append({
-                        "name": filename,
-                        "size": os.path.getsize(filepath),
-                        "type": "upload"
-                    })
-        
-        # List output files
-        if os.path.exists(OUTPUT_DIR):
-            for filename in os.listdir(OUTPUT_DIR):
-                filepath = os.path.join(OUTPUT_DIR, filename)
-                if os.path.isfile(filepath):
-                    outputs.append({
-                        "name": filename,
-                        "size": os.path.getsize(filepath),
-                        "type": "output"
-                    })
+        def entry(row):
+            return {
+                "name": row["name"],
+                "size": row["size"],
+                "type": row["kind"],
+                "sha256": row["sha256"],  # None until the background indexer hashed it
+                "source": row["source"],
+                "last_access": row["last_access"],
+            }
+        uploads = [entry(r) for r in file_index.list("upload", offset, limit)]
+        outputs = [entry(r) for r in file_index.list("output", offset, limit)]
         
         return {
             "uploads": uploads,
             "outputs": outputs,
-            "total_size": sum(f["size"] for f in uploads + outputs)
+            "total_uploads": file_index.count("upload"),
+            "total_outputs": file_index.count("output"),
+            "total_size": file_index.total_size(),
+            "quota": STORAGE_QUOTA_BYTES,
+            "offset": offset,
+            "limit": limit
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -136,6 +433,9 @@ async def delete_file(file_type: str, filename: str):
         
         if os.path.exists(filepath):
             os.remove(filepath)
+            file_index.remove(file_type, filename)
+            if file_type == "upload":
+                remove_derived(filename)
             return {"message": f"Deleted {filename}"}
         else:
             raise HTTPException(status_code=404, detail="File not found")
@@ -157,13 +457,16 @@ async def delete_all_files(file_type: str):
         
         if file_type == "all":
             # Delete both uploads and outputs
-            for dir_path in [UPLOAD_DIR, OUTPUT_DIR]:
+            for kind, dir_path in [("upload", UPLOAD_DIR), ("output", OUTPUT_DIR)]:
                 if os.path.exists(dir_path):
                     for filename in os.listdir(dir_path):
                         filepath = os.path.join(dir_path, filename)
                         if os.path.isfile(filepath):
                             try:
                                 os.remove(filepath)
+                                file_index.remove(kind, filename)
+                                if kind == "upload":
+                                    remove_derived(filename)
                                 deleted_count += 1
                                 print(f"Deleted: {filepath}")
                             except Exception as file_error:
@@ -176,6 +479,8 @@ async def delete_all_files(file_type: str):
                     if os.path.isfile(filepath):
                         try:
                             os.remove(filepath)
+                            file_index.remove("upload", filename)
+                            remove_derived(filename)
                             deleted_count += 1
                             print(f"Deleted: {filepath}")
                         except Exception as file_error:
@@ -188,6 +493,7 @@ async def delete_all_files(file_type: str):
                     if os.path.isfile(filepath):
                         try:
                             os.remove(filepath)
+                            file_index.remove("output", filename)
                             deleted_count += 1
                             print(f"Deleted: {filepath}")
                         except Exception as file_error:
@@ -236,7 +542,9 @@ async def upload_video(file: UploadFile = File(...)):
         file_path = os.path.join(UPLOAD_DIR, safe_filename)
         
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            writer = HashingWriter(buffer)
+            shutil.copyfileobj(file.file, writer)
+        file_index.add("upload", safe_filename, sha256=writer.hexdigest())
             
         return {"filename": safe_filename, "original_name": file.filename}
     except Exception as e:
@@ -244,116 +552,498 @@ async def upload_video(file: UploadFile = File(...)):
 
 @app.post("/process")
 async def process_video(request: ProcessRequest):
+    # The job itself runs on processing_executor; waiting for it holds no
+    # request thread, so /progress, /logs and /metrics keep answering
+    if request.output_mode not in ("video", "audio", "hls"):
+        raise HTTPException(status_code=400, detail=f"Invalid output mode: '{request.output_mode}'")
+    if request.output_mode == "audio" and request.audio_format not in AUDIO_CODECS:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio format: '{request.audio_format}'")
+    if request.proxy and (request.proxy_height <= 0 or request.proxy_height % 2):
+        raise HTTPException(status_code=400, detail="proxy_height must be a positive even number")
+    if request.job_id is not None and not JOB_ID_PATTERN.match(request.job_id):
+        raise HTTPException(status_code=400, detail="job_id may only contain letters, digits, '_' and '-'")
+    job = register_job(request.job_id or str(uuid.uuid4()), request.filename, trace=request.trace)
+    output_filename = proxy_filename_for(request) if request.proxy else output_filename_for(request)
+    return await _run_job(job, request, output_filename, "process", lambda: _run_process(request, job))
+
+async def _run_job(job, request: ProcessRequest, output_filename, span_name, work, failed_status="failed"):
+    """
+    Queue one job step on processing_executor and wait for its result.
+    On success the job takes the status in the result (default "succeeded"),
+    on failure failed_status.
+    """
+    # Keep the evictor away from this job's files until it is done
+    pinned = [("upload", request.filename)]
+    if output_filename:
+        pinned.append(("output", output_filename))
+    for kind, name in pinned:
+        file_index.pin(kind, name)
+    QUEUE_DEPTH.inc()
+    future = processing_executor.submit(_job_step, job, request, pinned, span_name, work, failed_status)
+    # Shielded: a client that disconnects doesn't cancel a queued job
+    return await asyncio.shield(asyncio.wrap_future(future))
+
+def _job_step(job, request: ProcessRequest, pinned, span_name, work, failed_status):
+    """Body of a queued job step, with status and metrics; releases the pins when done"""
+    try:
+        QUEUE_DEPTH.dec()
+        ACTIVE_JOBS.inc()
+        job["status"] = "running"
+        started = time.perf_counter()
+        succeeded = False
+        try:
+            with job["tracer"].span(span_name, filename=request.filename):
+                result = work()
+            succeeded = True
+            return result
+        finally:
+            job["status"] = result.get("status", "succeeded") if succeeded else failed_status
+            STAGE_SECONDS.observe(time.perf_counter() - started, stage="total")
+            JOBS_TOTAL.inc(status="succeeded" if succeeded else "failed")
+            ACTIVE_JOBS.dec()
+    finally:
+        for kind, name in pinned:
+            file_index.unpin(kind, name)
+
+def _prepare_input(request: ProcessRequest, job):
+    """Point /progress and /logs at the job and check its input; returns the input path"""
     global processing_progress, processing_logs
     processing_progress = 0
-    processing_logs = []  # Clear logs for new processing
+    processing_logs = job["logs"]  # /logs follows the new job
     
     input_path = os.path.join(UPLOAD_DIR, request.filename)
     if not os.path.exists(input_path):
         raise HTTPException(status_code=404, detail="File not found")
+    file_index.touch("upload", request.filename)
         
     # Check if FFmpeg is available
     if not shutil.which(video_editor.ffmpeg_bin) and not os.path.exists(video_editor.ffmpeg_bin):
         raise HTTPException(status_code=500, detail="FFmpeg not found. Please install FFmpeg and add it to your system PATH.")
-    
+    return input_path
+
+def _failure(e):
+    """Log a processing error and turn it into a 500"""
+    import traceback
+    traceback.print_exc()
+    add_log(f"Processing failed: {e}", level="error")
+    return HTTPException(status_code=500, detail=str(e))
+
+def _run_process(request: ProcessRequest, job):
+    global processing_progress
+    input_path = _prepare_input(request, job)
+    tracer = job["tracer"]
+    audio_path = os.path.join(TEMP_DIR, f"{request.filename}.wav")
     try:
         add_log("Starting video processing...")
         add_log(f"Input file: {request.filename}")
         
         # 1. Extract Audio
-        add_log("[Step 1/3] Extracting audio...")
-        audio_path = os.path.join(TEMP_DIR, f"{request.filename}.wav")
-        video_editor.extract_audio(input_path, audio_path)
+        add_log("[Step 1/3] Extracting audio...", stage="extract_audio")
+        video_editor.extract_audio(input_path, audio_path, tracer=tracer)
         processing_progress = 10
-        add_log(f"Audio extracted (Progress: {processing_progress}%)")
+        add_log(f"Audio extracted (Progress: {processing_progress}%)", stage="extract_audio")
         
         # 2. Detect Silence
-        add_log("[Step 2/3] Detecting speech with VAD...")
+        add_log("[Step 2/3] Detecting speech with VAD...", stage="vad")
         speech_timestamps = vad_processor.get_speech_timestamps(
             audio_path, 
             threshold=request.silence_threshold,
             min_silence_duration=request.min_silence_duration,
-            padding=request.padding
+            padding=request.padding,
+            tracer=tracer,
+            waveform_dir=waveform_dir_for(request.filename)
         )
-        add_log(f"Detected {len(speech_timestamps)} speech segments")
+        add_log(f"Detected {len(speech_timestamps)} speech segments", stage="vad")
+        file_index.add("waveform", request.filename, source=request.filename)
+        segments_id = store_segments(speech_timestamps, request.filename)
+        job["segments_id"] = segments_id
         processing_progress = 20
-        add_log(f"VAD complete (Progress: {processing_progress}%)")
+        add_log(f"VAD complete (Progress: {processing_progress}%)", stage="vad")
         
-        # 3. Cut Video
-        add_log("[Step 3/3] Cutting and encoding video...")
-        output_filename = f"processed_{request.filename}"
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
+        # 3. Cut: a quick proxy to approve first, or the final output straight away
+        if request.proxy:
+            result = _render_proxy(request, job, input_path, speech_timestamps)
+        else:
+            result = _render_output(request, job, input_path, speech_timestamps, progress_start=20)
+        result["segments_id"] = segments_id
+        result["segments"] = speech_timestamps if request.include_segments else None
+        return result
         
-        # Pass callback to cut_video
-        # We map the remaining 80% (20-100) to the cut progress
-        def mapped_callback(p):
-            global processing_progress
-            processing_progress = 20 + int(p * 0.8)
-            add_log(f"Encoding progress: {int(p)}%")
-            
+    except Exception as e:
+        raise _failure(e)
+    finally:
+        # 4. Cleanup
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+
+def _progress_callback(progress_start, stage, label):
+    """Map cut progress (0-100) onto the remaining job progress"""
+    def mapped_callback(p):
+        global processing_progress
+        processing_progress = progress_start + int(p * (100 - progress_start) / 100)
+        add_log(f"{label} progress: {int(p)}%", stage=stage)
+    return mapped_callback
+
+def _render_proxy(request: ProcessRequest, job, input_path, segments):
+    global processing_progress
+    add_log(f"[Step 3/3] Rendering {request.proxy_height}p preview proxy...", stage="proxy")
+    proxy_filename = proxy_filename_for(request)
+    original_duration, final_duration = video_editor.render_proxy(
+        input_path,
+        os.path.join(OUTPUT_DIR, proxy_filename),
+        segments,
+        progress_callback=_progress_callback(20, "proxy", "Proxy"),
+        height=request.proxy_height,
+        batch_size=request.batch_size,
+        tracer=job["tracer"]
+    )
+    processing_progress = 100
+    file_index.add("output", proxy_filename, source=request.filename)
+    
+    # Kept for /jobs/{job_id}/approve, which renders the final output
+    job["request"] = request
+    job["proxy_file"] = proxy_filename
+    # ... from this input and these segments, so keep the evictor away until then
+    job["approval_pins"] = [("upload", request.filename),
+                            ("segments", segment_store.filename_for(job["segments_id"]))]
+    for kind, name in job["approval_pins"]:
+        file_index.pin(kind, name)
+    add_log("=== Proxy ready, awaiting approval ===")
+    return {
+        "job_id": job["job_id"],
+        "status": "awaiting_approval",
+        "proxy_file": proxy_filename,
+        "output_file": None,
+        "stream_url": None,
+        "original_duration": original_duration,
+        "final_duration": final_duration
+    }
+
+def _release_approval_pins(job):
+    for kind, name in job.pop("approval_pins", []):
+        file_index.unpin(kind, name)
+
+def _render_output(request: ProcessRequest, job, input_path, segments, progress_start):
+    global processing_progress
+    tracer = job["tracer"]
+    if request.output_mode == "audio":
+        add_log(f"[Step 3/3] Cutting audio ({request.audio_format})...", stage="encode")
+    elif request.output_mode == "hls":
+        add_log("[Step 3/3] Cutting and encoding video (streaming)...", stage="encode")
+    else:
+        add_log("[Step 3/3] Cutting and encoding video...", stage="encode")
+    output_filename = output_filename_for(request)
+    output_path = os.path.join(OUTPUT_DIR, output_filename) if output_filename else None
+    
+    # Pass callback to cut_video
+    # It maps the remaining progress (progress_start-100) to the cut progress
+    mapped_callback = _progress_callback(progress_start, "encode", "Encoding")
+        
+    if request.output_mode == "audio":
+        original_duration, final_duration = video_editor.cut_audio(
+            input_path,
+            output_path,
+            segments,
+            progress_callback=mapped_callback,
+            audio_format=request.audio_format,
+            audio_bitrate=request.audio_bitrate,
+            tracer=tracer
+        )
+    elif request.output_mode == "hls":
+        job["stream_dir"] = stream_dir_for(job["job_id"])
+        original_duration, final_duration = video_editor.cut_video_hls(
+            input_path,
+            job["stream_dir"],
+            segments,
+            progress_callback=mapped_callback,
+            batch_size=request.batch_size,
+            video_crf=request.video_crf,
+            video_cq=request.video_cq,
+            video_preset=request.video_preset,
+            audio_bitrate=request.audio_bitrate,
+            tracer=tracer
+        )
+    else:
         original_duration, final_duration = video_editor.cut_video(
             input_path, 
             output_path, 
-            speech_timestamps,
+            segments,
             progress_callback=mapped_callback,
             batch_size=request.batch_size,
             video_crf=request.video_crf,
             video_cq=request.video_cq,
             video_preset=request.video_preset,
-            audio_bitrate=request.audio_bitrate
+            audio_bitrate=request.audio_bitrate,
+            tracer=tracer
         )
+    
+    processing_progress = 100
+    if output_filename:
+        file_index.add("output", output_filename, source=request.filename)
+    else:
+        file_index.add("stream", job["job_id"], source=request.filename)
         
-        processing_progress = 100
-        
-        # 4. Cleanup
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
-            
-        print("\n=== Processing complete ===\n")
-        return {
-            "output_file": output_filename,
-            "segments": speech_timestamps,
-            "original_duration": original_duration,
-            "final_duration": final_duration
-        }
-        
+    add_log("=== Processing complete ===")
+    return {
+        "job_id": job["job_id"],
+        "output_file": output_filename,
+        "stream_url": f"/jobs/{job['job_id']}/stream/{HLS_PLAYLIST}" if request.output_mode == "hls" else None,
+        "original_duration": original_duration,
+        "final_duration": final_duration
+    }
+
+class ApproveRequest(BaseModel):
+    segments_id: Optional[str] = None  # Edited cut to render instead of the proxied one
+
+@app.post("/jobs/{job_id}/approve")
+async def approve_job(job_id: str, request: Optional[ApproveRequest] = None):
+    """Run the full-quality render of a job that was processed with proxy=true"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if "request" not in job:
+        raise HTTPException(status_code=409, detail="Job was not processed with proxy=true")
+    segments_id = (request.segments_id if request else None) or job["segments_id"]
+    segments = resolve_segments(None, segments_id)
+    process_request = job["request"]
+    # Only one approval may start the render
+    with jobs_lock:
+        if job["status"] != "awaiting_approval":
+            raise HTTPException(status_code=409, detail=f"Job is not awaiting approval (status: {job['status']})")
+        if not os.path.exists(os.path.join(UPLOAD_DIR, process_request.filename)):
+            # Deleted by hand despite the pin: this job can never be approved
+            job["status"] = "failed"
+            _release_approval_pins(job)
+            raise HTTPException(status_code=404, detail="Input file no longer exists; the job was marked failed")
+        job["status"] = "approved"
+    
+    def render():
+        input_path = _prepare_input(process_request, job)
+        add_log(f"Cut approved, rendering final output of {process_request.filename}...")
+        try:
+            result = _render_output(process_request, job, input_path, segments, progress_start=0)
+        except Exception as e:
+            raise _failure(e)
+        _release_approval_pins(job)
+        result["segments_id"] = segments_id
+        result["segments"] = segments.to_dicts() if process_request.include_segments else None
+        return result
+    
+    # A failed render leaves the proxy and segments valid, so the job can be approved again
+    return await _run_job(job, process_request, output_filename_for(process_request), "render", render,
+                          failed_status="awaiting_approval")
+
+@app.post("/analyze")
+def analyze_video(request: AnalyzeRequest):
+    """Extract audio and run VAD only: segments plus the waveform pyramid, no encoding"""
+    with pinned_uploads([request.filename]):
+        input_path = os.path.join(UPLOAD_DIR, request.filename)
+        if not os.path.exists(input_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        file_index.touch("upload", request.filename)
+    
+        audio_path = os.path.join(TEMP_DIR, f"{request.filename}.{uuid.uuid4().hex}.wav")
+        try:
+            video_editor.extract_audio(input_path, audio_path)
+            speech_timestamps = vad_processor.get_speech_timestamps(
+                audio_path,
+                threshold=request.silence_threshold,
+                min_silence_duration=request.min_silence_duration,
+                padding=request.padding,
+                waveform_dir=waveform_dir_for(request.filename)
+            )
+            file_index.add("waveform", request.filename, source=request.filename)
+            return {
+                "segments_id": store_segments(speech_timestamps, request.filename),
+                "segments": speech_timestamps if request.include_segments else None,
+                "segment_count": len(speech_timestamps),
+                "waveform": WaveformPyramid(waveform_dir_for(request.filename)).meta
+            }
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            if os.path.exists(audio_path):
+                os.remove(audio_path)
+
+@app.post("/analyze-batch")
+def analyze_batch(request: AnalyzeBatchRequest):
+    """Analyze many uploads at once: parallel audio extraction, then one batched VAD pass"""
+    # Each file is analyzed once, however often it is listed
+    filenames = list(dict.fromkeys(request.filenames))
+    with pinned_uploads(filenames):
+        missing = [f for f in filenames if not os.path.exists(os.path.join(UPLOAD_DIR, f))]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"File not found: {', '.join(missing)}")
+    
+        token = uuid.uuid4().hex
+        audio_paths = [os.path.join(TEMP_DIR, f"{filename}.{token}.wav") for filename in filenames]
+        try:
+            list(vad_processor.executor.map(
+                video_editor.extract_audio,
+                [os.path.join(UPLOAD_DIR, f) for f in filenames],
+                audio_paths
+            ))
+            all_segments = vad_processor.get_speech_timestamps_batch(
+                audio_paths,
+                threshold=request.silence_threshold,
+                min_silence_duration=request.min_silence_duration,
+                padding=request.padding
+            )
+            by_filename = {}
+            for filename, segments in zip(filenames, all_segments):
+                file_index.touch("upload", filename)
+                by_filename[filename] = {
+                    "filename": filename,
+                    "segments_id": store_segments(segments, filename),
+                    "segments": segments if request.include_segments else None,
+                    "segment_count": len(segments)
+                }
+            # One result per requested name, in request order
+            return {"results": [by_filename[filename] for filename in request.filenames]}
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            for audio_path in audio_paths:
+                if os.path.exists(audio_path):
+                    os.remove(audio_path)
+
+def _load_waveform(filename):
+    path = waveform_dir_for(filename)
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        raise HTTPException(status_code=404, detail="No waveform for this file; run /analyze or /process first")
+    file_index.touch("waveform", filename)
+    return WaveformPyramid(path)
+
+@app.get("/waveform/{filename}/meta")
+def get_waveform_meta(filename: str):
+    return _load_waveform(filename).meta
+
+@app.get("/waveform/{filename}")
+def get_waveform_tile(filename: str, start: float = 0.0, end: Optional[float] = None,
+                      level: Optional[int] = None, max_points: int = 2000):
+    """
+    Envelope tile for [start, end) seconds as little-endian int16 [min, max, rms]
+    triples. Without `level`, the finest level fitting in max_points is used.
+    """
+    pyramid = _load_waveform(filename)
+    if end is None:
+        end = pyramid.meta["duration"]
+    if level is None:
+        level = pyramid.level_for(start, end, max_points)
+    elif not 0 <= level < len(pyramid.levels):
+        raise HTTPException(status_code=400, detail="Invalid level")
+    first, data = pyramid.read(level, start, end)
+    return Response(
+        content=data.tobytes(),
+        media_type="application/octet-stream",
+        headers={
+            "X-Waveform-Level": str(level),
+            "X-Window-Seconds": str(pyramid.levels[level]["window_seconds"]),
+            "X-First-Window": str(first),
+            "X-Window-Count": str(len(data)),
+            "X-Scale": str(pyramid.meta["scale"]),
+        },
+    )
+
+@app.post("/segments")
+async def upload_segments(request: Request):
+    """Store a segment list: JSON {"segments": [...]} or an [n, 2] float64 .npy body"""
+    try:
+        if request.headers.get("content-type", "").startswith(NPY_MEDIA_TYPE):
+            segments = SegmentList.from_npy(await request.body())
+        else:
+            segments = SegmentList.from_dicts((await request.json())["segments"])
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=400, detail=f"Invalid segments: {e}")
+    return {"segments_id": store_segments(segments), "segment_count": len(segments)}
+
+@app.get("/segments/{segments_id}")
+def get_segments(segments_id: str, format: str = "json"):
+    """Stored segments as JSON, or as an [n, 2] float64 .npy array with format=npy"""
+    segments = load_segments(segments_id)
+    if segments is None:
+        raise HTTPException(status_code=404, detail="Segments not found")
+    if format == "npy":
+        return Response(content=segments.to_npy(), media_type=NPY_MEDIA_TYPE)
+    if format != "json":
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    return {"segments_id": segments_id, "segments": segments.to_dicts()}
+
+@app.delete("/segments/{segments_id}")
+def delete_segments(segments_id: str):
+    if segment_store.get(segments_id) is None:
+        raise HTTPException(status_code=404, detail="Segments not found")
+    segment_store.delete(segments_id)
+    file_index.remove("segments", segment_store.filename_for(segments_id))
+    return {"message": f"Deleted {segments_id}"}
+
+def resolve_segments(segments, segments_id):
+    """Segments sent inline win; otherwise look them up by id"""
+    if segments is not None:
+        return SegmentList.from_dicts(segments)
+    if segments_id is None:
+        raise HTTPException(status_code=400, detail="Provide segments or segments_id")
+    stored = load_segments(segments_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Segments not found")
+    return stored
 
 class ExportRequest(BaseModel):
     filename: str
-    segments: list
+    segments: Optional[list] = None
+    segments_id: Optional[str] = None  # Reference to stored segments instead of sending them
     format: str = "mlt"  # Changed default to Shotcut MLT
+    formats: Optional[List[str]] = None  # Several formats in one pass; overrides format
+    stream: bool = False  # Stream a single format in the response instead of saving it
+    fps: float = 30.0
 
 @app.post("/export-project")
-async def export_project(request: ExportRequest):
-    """Export project as Shotcut MLT XML"""
+def export_project(request: ExportRequest):
+    """Export project as Shotcut MLT, EDL, FCPXML and/or OpenTimelineIO"""
+    if request.fps < MIN_FPS:
+        raise HTTPException(status_code=400, detail=f"fps must be at least {MIN_FPS}")
+    segments = resolve_segments(request.segments, request.segments_id)
+    formats = request.formats or [request.format]
+    unsupported = [f for f in formats if f not in timeline_exporters]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {', '.join(unsupported)}")
+    
+    # Get absolute path to the uploaded video
+    video_path = os.path.join(UPLOAD_DIR, request.filename)
+    base_name = os.path.splitext(request.filename)[0]
+    
+    if request.stream:
+        if len(formats) != 1:
+            raise HTTPException(status_code=400, detail="Streaming supports a single format")
+        exporter = timeline_exporters[formats[0]]
+        return StreamingResponse(
+            stream_timeline(exporter, video_path, segments, request.fps),
+            media_type=exporter.media_type,
+            headers={"Content-Disposition": f'attachment; filename="{base_name}{exporter.extension}"'},
+        )
+    
     try:
-        if request.format == "mlt":
-            # Get absolute path to the uploaded video
-            video_path = os.path.join(UPLOAD_DIR, request.filename)
-            content = shotcut_exporter.generate_mlt(video_path, request.segments)
-            
-            # Save to temp file
-            output_filename = f"{os.path.splitext(request.filename)[0]}.mlt"
-            output_path = os.path.join(OUTPUT_DIR, output_filename)
-            
-            with open(output_path, "w", encoding="utf-8") as f:
-                f.write(content)
-                
-            return {"filename": output_filename, "url": f"/outputs/{output_filename}"}
-        elif request.format == "edl":
-            content = project_exporter.generate_edl(request.filename, request.segments)
-            output_filename = f"{os.path.splitext(request.filename)[0]}.edl"
-            output_path = os.path.join(OUTPUT_DIR, output_filename)
-            with open(output_path, "w") as f:
-                f.write(content)
-            return {"filename": output_filename, "url": f"/outputs/{output_filename}"}
-        else:
-            raise HTTPException(status_code=400, detail="Unsupported format")
-            
+        files = []
+        with ExitStack() as stack:
+            sinks = []
+            for fmt in dict.fromkeys(formats):
+                exporter = timeline_exporters[fmt]
+                output_filename = f"{base_name}{exporter.extension}"
+                output_path = os.path.join(OUTPUT_DIR, output_filename)
+                f = stack.enter_context(open(output_path, "w", encoding="utf-8"))
+                sinks.append((exporter, f))
+                files.append({"format": fmt, "filename": output_filename, "url": f"/outputs/{output_filename}"})
+            # One pass over the segments writes every format
+            TimelineWriter(sinks).write(video_path, segments, request.fps)
+        
+        for entry in files:
+            file_index.add("output", entry["filename"], source=request.filename)
+        
+        return {"filename": files[0]["filename"], "url": files[0]["url"], "files": files}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
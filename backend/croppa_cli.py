@@ -0,0 +1,294 @@
+"""
+Headless batch runner for render farms.
+Processes every input matching the given globs with the same settings as the
+/process endpoint, using separate process pools for analysis (audio extraction
++ VAD) and encoding. Does not import the web stack.
+
+Usage:
+    python croppa_cli.py "footage/*.mp4" -o processed --encode-workers 2 --summary summary.json
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Per-process pipeline objects, created by the pool initializers
+_video_editor = None
+_vad_processor = None
+
+
+def _init_analysis_worker():
+    global _video_editor, _vad_processor
+    from video_editor import VideoEditor
+    from vad_processor import VADProcessor
+    _video_editor = VideoEditor()
+    _vad_processor = VADProcessor()
+
+
+def _init_encode_worker():
+    global _video_editor
+    from video_editor import VideoEditor
+    _video_editor = VideoEditor()
+
+
+def analyze_file(input_path, temp_dir, settings):
+    """Extract audio and detect speech; returns segments and timings"""
+    audio_path = os.path.join(temp_dir, f"{os.path.basename(input_path)}.{os.getpid()}.wav")
+    timings = {}
+    try:
+        started = time.perf_counter()
+        _video_editor.extract_audio(input_path, audio_path)
+        timings["extract_audio"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        segments = _vad_processor.get_speech_timestamps(
+            audio_path,
+            threshold=settings["silence_threshold"],
+            min_silence_duration=settings["min_silence_duration"],
+            padding=settings["padding"]
+        )
+        timings["vad"] = time.perf_counter() - started
+        return segments, timings
+    finally:
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+
+
+def encode_file(input_path, output_path, segments, settings):
+    """Cut and encode one file; returns durations and timings"""
+    started = time.perf_counter()
+    if settings["output_mode"] == "audio":
+        original_duration, final_duration = _video_editor.cut_audio(
+            input_path,
+            output_path,
+            segments,
+            audio_format=settings["audio_format"],
+            audio_bitrate=settings["audio_bitrate"]
+        )
+    else:
+        original_duration, final_duration = _video_editor.cut_video(
+            input_path,
+            output_path,
+            segments,
+            batch_size=settings["batch_size"],
+            video_crf=settings["video_crf"],
+            video_cq=settings["video_cq"],
+            video_preset=settings["video_preset"],
+            audio_bitrate=settings["audio_bitrate"]
+        )
+    return original_duration, final_duration, {"encode": time.perf_counter() - started}
+
+
+def output_path_for(relative_path, output_dir, settings):
+    """Output for an input at relative_path (below its glob root), mirroring its folders"""
+    folder, name = os.path.split(relative_path)
+    if settings["output_mode"] == "audio":
+        name = f"{os.path.splitext(name)[0]}.{settings['audio_format']}"
+    return os.path.join(output_dir, folder, f"processed_{name}")
+
+
+# Settings a mode ignores; changing them doesn't make its outputs stale
+_UNUSED_SETTINGS = {
+    "video": ("audio_format",),
+    "audio": ("batch_size", "video_crf", "video_cq", "video_preset"),
+}
+
+
+def output_settings(settings):
+    return {k: v for k, v in settings.items() if k not in _UNUSED_SETTINGS[settings["output_mode"]]}
+
+
+def settings_path_for(output_path):
+    """Sidecar recording the settings an output was rendered with"""
+    return f"{output_path}.croppa.json"
+
+
+def is_up_to_date(input_path, output_path, settings):
+    if not (os.path.exists(output_path)
+            and os.path.getmtime(output_path) >= os.path.getmtime(input_path)):
+        return False
+    try:
+        with open(settings_path_for(output_path), encoding="utf-8") as f:
+            return json.load(f) == output_settings(settings)
+    except (OSError, ValueError):
+        return False
+
+
+def glob_root(pattern):
+    """Folder a pattern's matches are relative to: everything before the first wildcard"""
+    parts = os.path.normpath(pattern).split(os.sep)
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return os.sep.join(parts[:i]) or ("." if i == 0 else os.sep)
+    return os.path.dirname(pattern) or "."
+
+
+def expand_inputs(patterns):
+    """(absolute input path, path relative to its glob root) for every matched file"""
+    inputs = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        root = glob_root(pattern)
+        for match in matches:
+            # Keep order, drop duplicates from overlapping globs
+            if os.path.isfile(match):
+                inputs.setdefault(os.path.abspath(match), os.path.relpath(match, root))
+    return list(inputs.items())
+
+
+def find_collisions(inputs, output_dir, settings):
+    """Groups of inputs that would be written to the same output"""
+    by_output = {}
+    for input_path, relative_path in inputs:
+        output_path = os.path.normcase(os.path.abspath(output_path_for(relative_path, output_dir, settings)))
+        by_output.setdefault(output_path, []).append(input_path)
+    return [paths for paths in by_output.values() if len(paths) > 1]
+
+
+def run_batch(inputs, output_dir, settings, analysis_workers, encode_workers, force=False, temp_dir=None):
+    """Process inputs, (input path, relative path) pairs from expand_inputs; returns the summary dict"""
+    os.makedirs(output_dir, exist_ok=True)
+    temp_dir = temp_dir or os.path.join(output_dir, "temp")
+    os.makedirs(temp_dir, exist_ok=True)
+
+    batch_started = time.perf_counter()
+    results = {}
+    pending_analysis = []
+
+    for input_path, relative_path in inputs:
+        output_path = output_path_for(relative_path, output_dir, settings)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        results[input_path] = {"input": input_path, "output": output_path, "status": "pending", "timings": {}}
+        if not force and is_up_to_date(input_path, output_path, settings):
+            results[input_path]["status"] = "skipped"
+            print(f"Skipping (up to date): {input_path}")
+        else:
+            # Until the new render finishes, the old output no longer counts as up to date
+            if os.path.exists(settings_path_for(output_path)):
+                os.remove(settings_path_for(output_path))
+            pending_analysis.append(input_path)
+
+    # Spawn: CUDA cannot be used in forked children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(analysis_workers, mp_context=context, initializer=_init_analysis_worker) as analysis_pool, \
+            ProcessPoolExecutor(encode_workers, mp_context=context, initializer=_init_encode_worker) as encode_pool:
+        futures = {}
+        for input_path in pending_analysis:
+            future = analysis_pool.submit(analyze_file, input_path, temp_dir, settings)
+            futures[future] = ("analyze", input_path, time.perf_counter())
+
+        # Encodes start as soon as their analysis finishes
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, input_path, submitted = futures.pop(future)
+                result = results[input_path]
+                try:
+                    if stage == "analyze":
+                        segments, timings = future.result()
+                        result["timings"].update(timings)
+                        result["segments"] = len(segments)
+                        print(f"Analyzed {input_path}: {len(segments)} segments")
+                        encode_future = encode_pool.submit(encode_file, input_path, result["output"], segments, settings)
+                        futures[encode_future] = ("encode", input_path, submitted)
+                    else:
+                        original_duration, final_duration, timings = future.result()
+                        result["timings"].update(timings)
+                        result["timings"]["total"] = time.perf_counter() - submitted
+                        result["original_duration"] = original_duration
+                        result["final_duration"] = final_duration
+                        result["status"] = "done"
+                        with open(settings_path_for(result["output"]), "w", encoding="utf-8") as f:
+                            json.dump(output_settings(settings), f, indent=2)
+                        print(f"Finished {input_path} -> {result['output']}")
+                except Exception as e:
+                    result["status"] = "failed"
+                    result["error"] = f"{stage}: {e}"
+                    print(f"Failed {input_path} ({stage}): {e}")
+
+    statuses = [r["status"] for r in results.values()]
+    return {
+        "settings": settings,
+        "analysis_workers": analysis_workers,
+        "encode_workers": encode_workers,
+        "wall_time": time.perf_counter() - batch_started,
+        "done": statuses.count("done"),
+        "skipped": statuses.count("skipped"),
+        "failed": statuses.count("failed"),
+        "files": list(results.values()),
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Croppa headless batch runner")
+    parser.add_argument("inputs", nargs="+", help="Input files or glob patterns")
+    parser.add_argument("-o", "--output-dir", default="outputs", help="Directory for processed files")
+    parser.add_argument("--temp-dir", help="Directory for intermediate audio (default: <output-dir>/temp)")
+    parser.add_argument("--summary", help="Write a JSON summary with timings to this path")
+    parser.add_argument("--force", action="store_true", help="Re-process files whose output is up to date")
+    cpu_count = os.cpu_count() or 1
+    parser.add_argument("--analysis-workers", type=int, default=min(4, cpu_count),
+                        help="Parallel audio extraction + VAD processes")
+    parser.add_argument("--encode-workers", type=int, default=max(1, cpu_count // 4),
+                        help="Parallel encoding processes")
+    # Same knobs and defaults as ProcessRequest
+    parser.add_argument("--silence-threshold", type=float, default=-40.0)
+    parser.add_argument("--min-silence-duration", type=float, default=0.5)
+    parser.add_argument("--padding", type=float, default=0.25)
+    parser.add_argument("--batch-size", type=int, default=15)
+    parser.add_argument("--video-crf", type=int, default=18)
+    parser.add_argument("--video-cq", type=int, default=19)
+    parser.add_argument("--video-preset", default="p4")
+    parser.add_argument("--audio-bitrate", type=int, default=192)
+    parser.add_argument("--output-mode", choices=["video", "audio"], default="video",
+                        help="'audio' writes only the trimmed audio and skips video encoding")
+    parser.add_argument("--audio-format", choices=["m4a", "opus", "wav"], default="m4a")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        print("No input files matched")
+        return 1
+
+    settings = {
+        "silence_threshold": args.silence_threshold,
+        "min_silence_duration": args.min_silence_duration,
+        "padding": args.padding,
+        "batch_size": args.batch_size,
+        "video_crf": args.video_crf,
+        "video_cq": args.video_cq,
+        "video_preset": args.video_preset,
+        "audio_bitrate": args.audio_bitrate,
+        "output_mode": args.output_mode,
+        "audio_format": args.audio_format,
+    }
+    collisions = find_collisions(inputs, args.output_dir, settings)
+    if collisions:
+        for paths in collisions:
+            print(f"Same output for: {', '.join(paths)}")
+        print("Inputs from different glob roots map to the same output; run them separately")
+        return 1
+    print(f"Processing {len(inputs)} files "
+          f"({args.analysis_workers} analysis / {args.encode_workers} encode workers)")
+    summary = run_batch(inputs, args.output_dir, settings, args.analysis_workers, args.encode_workers,
+                        force=args.force, temp_dir=args.temp_dir)
+
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    print(f"Done: {summary['done']}, skipped: {summary['skipped']}, failed: {summary['failed']} "
+          f"in {summary['wall_time']:.1f}s")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+Final Cut Pro XML Project Exporter
+Generates FCPXML 1.9 projects (Final Cut Pro, DaVinci Resolve, Premiere via
+plugins) with one asset-clip per segment on the primary storyline.
+"""
+import io
+import os
+import pathlib
+from xml.sax.saxutils import quoteattr
+from timeline_writer import TimelineWriter, rational_fps
+
+class FCPXMLExporter:
+    format_name = "fcpxml"
+    extension = ".fcpxml"
+    media_type = "application/xml"
+
+    def __init__(self):
+        pass
+
+    def generate_fcpxml(self, video_path: str, segments: list, fps: float = 30.0) -> str:
+        """Generate an FCPXML project as a string"""
+        out = io.StringIO()
+        TimelineWriter([(self, out)]).write(video_path, segments, fps)
+        return out.getvalue()
+
+    def _time(self, frames, fps):
+        """Rational FCPXML time for a frame count (1001/30000s per frame at 29.97)"""
+        num, den = rational_fps(fps)
+        return f"{frames * den}/{num}s" if frames else "0s"
+
+    def _frames(self, seconds, fps):
+        """Nearest frame at the exact rate (so 29.97 doesn't drift against 30000/1001)"""
+        num, den = rational_fps(fps)
+        return round(seconds * num / den)
+
+    def write_header(self, out, video_path, segments, fps):
+        abs_path = os.path.abspath(video_path)
+        name = os.path.splitext(os.path.basename(abs_path))[0]
+        source_frames = self._frames(segments.ends[-1], fps) if len(segments) else 0
+        sequence_frames = self._frames(segments.total_duration(), fps)
+        out.write(f'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE fcpxml>
+<fcpxml version="1.9">
+  <resources>
+    <format id="r1" frameDuration="{self._time(1, fps)}" width="1920" height="1080"/>
+    <asset id="r2" name={quoteattr(name)} start="0s" duration="{self._time(source_frames, fps)}" hasVideo="1" hasAudio="1" format="r1">
+      <media-rep kind="original-media" src={quoteattr(pathlib.Path(abs_path).as_uri())}/>
+    </asset>
+  </resources>
+  <library>
+    <event name="Croppa">
+      <project name="Croppa Project">
+        <sequence format="r1" duration="{self._time(sequence_frames, fps)}" tcStart="0s" tcFormat="NDF">
+          <spine>
+''')
+
+    def write_clip(self, out, video_path, index, start, end, record_start, fps):
+        # Derive duration from the record positions so clips stay contiguous
+        offset = self._frames(record_start, fps)
+        duration = self._frames(record_start + end - start, fps) - offset
+        source_in = self._frames(start, fps)
+        out.write(f'            <asset-clip ref="r2" name="Segment {index + 1}" '
+                  f'offset="{self._time(offset, fps)}" start="{self._time(source_in, fps)}" '
+                  f'duration="{self._time(duration, fps)}"/>\n')
+
+    def write_footer(self, out, video_path, segments, fps):
+        out.write('''          </spine>
+        </sequence>
+      </project>
+    </event>
+  </library>
+</fcpxml>
+''')
@@ -0,0 +1,328 @@
+"""
+Persistent index of stored uploads, outputs and the artifacts derived from them.
+Tracks size, hash, last access and which upload an entry came from, so file
+listings don't have to walk the directories, and enforces a storage quota by
+evicting least-recently-used entries that no active job is using.
+Hashes are filled in by a background thread, so neither startup nor a request
+ever has to read a whole multi-GB file.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+FILE_KINDS = ("upload", "output", "waveform", "segments", "stream")
+# Kinds stored as a folder per entry rather than a single file
+DIRECTORY_KINDS = ("waveform", "stream")
+# Kinds that are hashed (user-visible media)
+HASHED_KINDS = ("upload", "output")
+# Kinds that are useless without their source upload and are deleted with it
+DERIVED_KINDS = ("waveform", "segments")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    source TEXT,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (kind, name)
+);
+CREATE INDEX IF NOT EXISTS files_last_access ON files (last_access);
+CREATE INDEX IF NOT EXISTS files_source ON files (source);
+"""
+
+
+def sha256_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def disk_size(path):
+    """Size of a file, or of everything below a folder"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class HashingWriter:
+    """File wrapper that hashes bytes as they are written (for uploads)"""
+
+    def __init__(self, f):
+        self._f = f
+        self._digest = hashlib.sha256()
+
+    def write(self, data):
+        self._digest.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+
+class FileIndex:
+    def __init__(self, db_path, directories):
+        """
+        Args:
+            db_path: SQLite database file
+            directories: Dict mapping each kind in FILE_KINDS to its directory
+        """
+        self.directories = directories
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+        # (kind, name) -> number of active jobs using the file
+        self._pins = Counter()
+        # Set when rows without a hash were added
+        self._unhashed = threading.Event()
+        self._unhashed.set()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def path_for(self, kind, name):
+        return os.path.join(self.directories[kind], name)
+
+    def add(self, kind, name, source=None, sha256=None):
+        """Record (or refresh) an entry that now exists on disk; without sha256 it is hashed later"""
+        path = self.path_for(kind, name)
+        size = disk_size(path)
+        now = time.time()
+        self._execute(
+            """INSERT INTO files (kind, name, path, size, sha256, source, created, last_access)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (kind, name) DO UPDATE SET
+                   size = excluded.size, sha256 = excluded.sha256,
+                   source = COALESCE(excluded.source, files.source),
+                   last_access = excluded.last_access""",
+            (kind, name, path, size, sha256, source, now, now),
+        )
+        if sha256 is None and kind in HASHED_KINDS:
+            self._unhashed.set()
+
+    def touch(self, kind, name):
+        self._execute(
+            "UPDATE files SET last_access = ? WHERE kind = ? AND name = ?",
+            (time.time(), kind, name),
+        )
+
+    def remove(self, kind, name):
+        self._execute("DELETE FROM files WHERE kind = ? AND name = ?", (kind, name))
+
+    def delete(self, kind, name):
+        """Delete an entry from disk and the index, with the entries derived from it; returns bytes freed"""
+        row = self.get(kind, name)
+        path = self.path_for(kind, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        self.remove(kind, name)
+        freed = row["size"] if row else 0
+        if kind == "upload":
+            freed += self.delete_derived(name)
+        return freed
+
+    def delete_derived(self, source):
+        """Delete the derived entries (waveforms, segments) of an upload; returns bytes freed"""
+        placeholders = ", ".join("?" for _ in DERIVED_KINDS)
+        rows = self._query(
+            f"SELECT kind, name FROM files WHERE source = ? AND kind IN ({placeholders})",
+            (source, *DERIVED_KINDS),
+        )
+        freed = 0
+        for row in rows:
+            try:
+                freed += self.delete(row["kind"], row["name"])
+            except OSError as e:
+                print(f"Failed to delete {row['kind']} {row['name']}: {e}")
+        return freed
+
+    def get(self, kind, name):
+        rows = self._query("SELECT * FROM files WHERE kind = ? AND name = ?", (kind, name))
+        return dict(rows[0]) if rows else None
+
+    def list(self, kind, offset=0, limit=100):
+        """One page of files of a kind, newest first"""
+        rows = self._query(
+            "SELECT * FROM files WHERE kind = ? ORDER BY created DESC, name LIMIT ? OFFSET ?",
+            (kind, limit, offset),
+        )
+        return [dict(row) for row in rows]
+
+    def count(self, kind=None):
+        if kind is None:
+            return self._query("SELECT COUNT(*) FROM files")[0][0]
+        return self._query("SELECT COUNT(*) FROM files WHERE kind = ?", (kind,))[0][0]
+
+    def total_size(self, kind=None):
+        if kind is None:
+            return self._query("SELECT COALESCE(SUM(size), 0) FROM files")[0][0]
+        return self._query("SELECT COALESCE(SUM(size), 0) FROM files WHERE kind = ?", (kind,))[0][0]
+
+    def outputs_of(self, source):
+        rows = self._query("SELECT * FROM files WHERE kind = 'output' AND source = ?", (source,))
+        return [dict(row) for row in rows]
+
+    def reconcile(self):
+        """Sync the index with the directories (startup, or after manual edits)"""
+        for kind, directory in self.directories.items():
+            # Folder kinds hold one folder per entry; file kinds skip folders (e.g. temp batches)
+            want_dirs = kind in DIRECTORY_KINDS
+            on_disk = set()
+            if os.path.exists(directory):
+                for name in os.listdir(directory):
+                    if os.path.isdir(os.path.join(directory, name)) == want_dirs:
+                        on_disk.add(name)
+            indexed = {row["name"] for row in self._query("SELECT name FROM files WHERE kind = ?", (kind,))}
+            for name in on_disk - indexed:
+                # Waveform folders are named after their upload
+                self.add(kind, name, source=name if kind == "waveform" else None)
+            for name in indexed - on_disk:
+                self.remove(kind, name)
+
+    def wait_for_unhashed(self, timeout=None):
+        return self._unhashed.wait(timeout)
+
+    def fill_hashes(self):
+        """Hash every indexed file that has no hash yet; returns how many were hashed"""
+        self._unhashed.clear()
+        placeholders = ", ".join("?" for _ in HASHED_KINDS)
+        rows = self._query(
+            f"SELECT kind, name, path, size FROM files WHERE sha256 IS NULL AND kind IN ({placeholders})",
+            HASHED_KINDS,
+        )
+        hashed = 0
+        for row in rows:
+            try:
+                sha256 = sha256_file(row["path"])
+            except OSError:
+                continue  # Deleted meanwhile
+            # Skip files that were replaced while we read them
+            self._execute(
+                "UPDATE files SET sha256 = ? WHERE kind = ? AND name = ? AND size = ? AND sha256 IS NULL",
+                (sha256, row["kind"], row["name"], row["size"]),
+            )
+            hashed += 1
+        return hashed
+
+    # --- Active job pins ---
+
+    def pin(self, kind, name):
+        with self._lock:
+            self._pins[(kind, name)] += 1
+
+    def unpin(self, kind, name):
+        with self._lock:
+            self._pins[(kind, name)] -= 1
+            if self._pins[(kind, name)] <= 0:
+                del self._pins[(kind, name)]
+
+    def is_pinned(self, kind, name):
+        with self._lock:
+            return (kind, name) in self._pins
+
+    # --- Eviction ---
+
+    def evict_to_quota(self, quota_bytes):
+        """Delete least-recently-used unpinned entries until usage fits the quota"""
+        total = self.total_size()
+        evicted = []
+        if total <= quota_bytes:
+            return evicted
+        candidates = self._query("SELECT kind, name, path, size, source FROM files ORDER BY last_access ASC")
+        for row in candidates:
+            if total <= quota_bytes:
+                break
+            if self.is_pinned(row["kind"], row["name"]):
+                continue
+            # A job using an upload may still need what was derived from it
+            if row["kind"] in DERIVED_KINDS and row["source"] and self.is_pinned("upload", row["source"]):
+                continue
+            if self.get(row["kind"], row["name"]) is None:
+                continue  # Already deleted along with its upload
+            try:
+                total -= self.delete(row["kind"], row["name"])
+            except OSError as e:
+                print(f"Evictor: failed to delete {row['path']}: {e}")
+                continue
+            evicted.append((row["kind"], row["name"]))
+        if evicted:
+            print(f"Evictor: removed {len(evicted)} files, storage now {total} bytes")
+        return evicted
+
+
+class Evictor:
+    """Background thread enforcing a byte quota on a FileIndex"""
+
+    def __init__(self, index, quota_bytes, interval=60.0):
+        self.index = index
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="croppa-evictor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.index.evict_to_quota(self.quota_bytes)
+            except Exception as e:
+                print(f"Evictor error: {e}")
+
+
+class Indexer:
+    """Background thread that reconciles a FileIndex with the disk and fills in hashes"""
+
+    def __init__(self, index):
+        self.index = index
+        self._thread = threading.Thread(target=self._run, name="croppa-indexer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.index.reconcile()
+        except Exception as e:
+            print(f"Indexer error: {e}")
+        while True:
+            self.index.wait_for_unhashed()
+            try:
+                hashed = self.index.fill_hashes()
+                if hashed:
+                    print(f"Indexer: hashed {hashed} files")
+            except Exception as e:
+                print(f"Indexer error: {e}")
+                time.sleep(60)
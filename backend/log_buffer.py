@@ -0,0 +1,112 @@
+"""
+Bounded per-job log buffers.
+Each job keeps its most recent log entries in a ring buffer; console output is
+handed to a background thread so logging never blocks the processing loop.
+"""
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+
+class LogEntry:
+    __slots__ = ("seq", "timestamp", "level", "stage", "message")
+
+    def __init__(self, seq, timestamp, level, stage, message):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.level = level
+        self.stage = stage
+        self.message = message
+
+    def to_dict(self):
+        return {
+            "seq": self.seq,
+            "timestamp": self.timestamp,
+            "level": self.level,
+            "stage": self.stage,
+            "message": self.message,
+        }
+
+    def format(self):
+        stamp = time.strftime("%H:%M:%S", time.localtime(self.timestamp))
+        stage = f" [{self.stage}]" if self.stage else ""
+        return f"{stamp} {self.level.upper():<5}{stage} {self.message}"
+
+
+class ConsoleLogHandler:
+    """Writes log entries to stdout from a daemon thread"""
+
+    def __init__(self, stream=None):
+        self._stream = stream
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, name="croppa-log-writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, entry):
+        self._queue.put(entry)
+
+    def _drain(self):
+        while True:
+            entry = self._queue.get()
+            lines = [entry.format()]
+            # Batch whatever else is pending into a single flush
+            try:
+                while True:
+                    lines.append(self._queue.get_nowait().format())
+            except queue.Empty:
+                pass
+            stream = self._stream or sys.stdout
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except Exception:
+                pass
+
+
+class LogBuffer:
+    """Ring buffer of the most recent `capacity` entries of one job"""
+
+    def __init__(self, capacity=2000, handler=None):
+        self.capacity = capacity
+        self._entries = deque(maxlen=capacity)
+        self._handler = handler
+        self._lock = threading.Lock()
+        self._next_seq = 0
+
+    def add(self, message, level="info", stage=None):
+        with self._lock:
+            entry = LogEntry(self._next_seq, time.time(), level, stage, message)
+            self._next_seq += 1
+            self._entries.append(entry)
+        if self._handler is not None:
+            self._handler.emit(entry)
+        return entry
+
+    def entries(self, since=None):
+        """Entries with a sequence number greater than `since` (all if None)"""
+        with self._lock:
+            entries = list(self._entries)
+        if since is not None:
+            entries = [e for e in entries if e.seq > since]
+        return entries
+
+    @property
+    def dropped(self):
+        """Number of entries that fell out of the ring buffer"""
+        with self._lock:
+            return self._next_seq - len(self._entries)
+
+
+_console_handler = None
+_console_handler_lock = threading.Lock()
+
+
+def console_handler():
+    """Process-wide console handler, started on first use"""
+    global _console_handler
+    with _console_handler_lock:
+        if _console_handler is None:
+            _console_handler = ConsoleLogHandler()
+        return _console_handler
@@ -0,0 +1,214 @@
+"""
+Prometheus-style metrics for the processing pipeline.
+A tiny dependency-free registry of counters, gauges and histograms that renders
+the Prometheus text exposition format for the /metrics endpoint.
+"""
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage durations range from sub-second VAD passes to hour-long encodes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{v}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Pipeline metrics shared by VideoEditor, VADProcessor, the exporters and app.py
+STAGE_SECONDS = registry.histogram(
+    "croppa_stage_duration_seconds",
+    "Wall-clock time spent in each pipeline stage",
+    ["stage"],
+)
+ENCODE_SPEED = registry.histogram(
+    "croppa_encode_speed_realtime",
+    "Encode speed as a multiple of realtime (media seconds per wall-clock second)",
+    ["encoder"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+BYTES_READ = registry.counter(
+    "croppa_bytes_read_total",
+    "Bytes of media read by the pipeline",
+    ["stage"],
+)
+BYTES_WRITTEN = registry.counter(
+    "croppa_bytes_written_total",
+    "Bytes of media written by the pipeline",
+    ["stage"],
+)
+ENCODER_SELECTED = registry.counter(
+    "croppa_encoder_selected_total",
+    "Number of renders per selected video encoder",
+    ["encoder"],
+)
+CACHE_REQUESTS = registry.counter(
+    "croppa_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    ["cache", "result"],
+)
+QUEUE_DEPTH = registry.gauge(
+    "croppa_queue_depth",
+    "Processing requests waiting for the pipeline",
+)
+ACTIVE_JOBS = registry.gauge(
+    "croppa_active_jobs",
+    "Processing requests currently running",
+)
+# Export zeros before the first job so alerts have a series to evaluate
+QUEUE_DEPTH.set(0)
+ACTIVE_JOBS.set(0)
+JOBS_TOTAL = registry.counter(
+    "croppa_jobs_total",
+    "Finished processing requests by outcome",
+    ["status"],
+)
+
+
+def file_size(path):
+    """Size of a file in bytes, or 0 if it cannot be read"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
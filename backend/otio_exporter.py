@@ -0,0 +1,59 @@
+"""
+OpenTimelineIO Project Exporter
+Writes native .otio JSON (Timeline.1 schema) without the opentimelineio
+package: one video track with a clip per segment.
+"""
+import io
+import json
+import os
+import pathlib
+from timeline_writer import TimelineWriter
+
+class OTIOExporter:
+    format_name = "otio"
+    extension = ".otio"
+    media_type = "application/json"
+
+    def __init__(self):
+        pass
+
+    def generate_otio(self, video_path: str, segments: list, fps: float = 30.0) -> str:
+        """Generate an OpenTimelineIO timeline as a JSON string"""
+        out = io.StringIO()
+        TimelineWriter([(self, out)]).write(video_path, segments, fps)
+        return out.getvalue()
+
+    def _rational_time(self, seconds, fps):
+        return {"OTIO_SCHEMA": "RationalTime.1", "rate": float(fps), "value": seconds * fps}
+
+    def write_header(self, out, video_path, segments, fps):
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        out.write('{"OTIO_SCHEMA": "Timeline.1", "name": ' + json.dumps(name) + ', "metadata": {}, '
+                  '"global_start_time": null, "tracks": {"OTIO_SCHEMA": "Stack.1", "name": "tracks", '
+                  '"metadata": {}, "effects": [], "markers": [], "source_range": null, "children": [\n'
+                  '{"OTIO_SCHEMA": "Track.1", "name": "V1", "kind": "Video", "metadata": {}, '
+                  '"effects": [], "markers": [], "source_range": null, "children": [\n')
+
+    def write_clip(self, out, video_path, index, start, end, record_start, fps):
+        clip = {
+            "OTIO_SCHEMA": "Clip.1",
+            "name": f"Segment {index + 1}",
+            "metadata": {},
+            "effects": [],
+            "markers": [],
+            "source_range": {
+                "OTIO_SCHEMA": "TimeRange.1",
+                "start_time": self._rational_time(start, fps),
+                "duration": self._rational_time(end - start, fps),
+            },
+            "media_reference": {
+                "OTIO_SCHEMA": "ExternalReference.1",
+                "target_url": pathlib.Path(os.path.abspath(video_path)).as_uri(),
+                "available_range": None,
+                "metadata": {},
+            },
+        }
+        out.write(("" if index == 0 else ",\n") + json.dumps(clip))
+
+    def write_footer(self, out, video_path, segments, fps):
+        out.write("\n]}\n]}}\n")
@@ -1,12 +1,19 @@
+import io
 import os
+from timeline_writer import TimelineWriter
 
 class ProjectExporter:
+    format_name = "edl"
+    extension = ".edl"
+    media_type = "text/plain"
+
     def __init__(self):
         pass
 
     def seconds_to_timecode(self, seconds, fps=30):
-        """Convert seconds to SMPTE timecode HH:MM:SS:FF"""
+        """Convert seconds to SMPTE timecode HH:MM:SS:FF (non-drop-frame on the nominal rate, e.g. 30 for 29.97)"""
         total_frames = int(seconds * fps)
+        fps = round(fps)
         
         ff = total_frames % fps
         total_seconds = total_frames // fps
@@ -18,38 +25,34 @@ class ProjectExporter:
         return f"{hh:02d}:{mm:02d}:{ss:02d}:{ff:02d}"
 
     def generate_edl(self, filename, segments, fps=30):
-        """Generate an EDL (Edit Decision List) string"""
-        title = os.path.splitext(filename)[0].upper()
-        edl = []
-        edl.append(f"TITLE: {title}")
-        edl.append("FCM: NON-DROP FRAME")
-        edl.append("")
-
-        timeline_seconds = 0.0
+        """Generate an EDL (Edit Decision List) string from a SegmentList or list of dicts"""
+        out = io.StringIO()
+        TimelineWriter([(self, out)]).write(filename, segments, fps)
+        return out.getvalue()
+
+    def write_header(self, out, filename, segments, fps):
+        title = os.path.splitext(os.path.basename(filename))[0].upper()
+        out.write(f"TITLE: {title}\n")
+        out.write("FCM: NON-DROP FRAME\n")
+
+    def write_clip(self, out, video_path, index, start, end, record_start, fps):
+        # Source In/Out
+        src_in = self.seconds_to_timecode(start, fps)
+        src_out = self.seconds_to_timecode(end, fps)
         
-        for i, seg in enumerate(segments):
-            index = f"{i+1:03d}"
-            
-            # Source In/Out
-            src_in = self.seconds_to_timecode(seg['start'], fps)
-            src_out = self.seconds_to_timecode(seg['end'], fps)
-            
-            # Timeline In/Out
-            duration = seg['end'] - seg['start']
-            rec_in = self.seconds_to_timecode(timeline_seconds, fps)
-            rec_out = self.seconds_to_timecode(timeline_seconds + duration, fps)
-            
-            # EDL Line: 001  AX  V  C  [SrcIn] [SrcOut] [RecIn] [RecOut]
-            # AX = Auxiliary/Unknown Tape Name
-            # V = Video
-            # C = Cut
-            line = f"{index}  AX       V     C        {src_in} {src_out} {rec_in} {rec_out}"
-            edl.append(line)
-            
-            # Update timeline position
-            timeline_seconds += duration
-
-        return "\n".join(edl)
+        # Timeline In/Out
+        duration = end - start
+        rec_in = self.seconds_to_timecode(record_start, fps)
+        rec_out = self.seconds_to_timecode(record_start + duration, fps)
+        
+        # EDL Line: 001  AX  V  C  [SrcIn] [SrcOut] [RecIn] [RecOut]
+        # AX = Auxiliary/Unknown Tape Name
+        # V = Video
+        # C = Cut
+        out.write(f"\n{index + 1:03d}  AX       V     C        {src_in} {src_out} {rec_in} {rec_out}")
+
+    def write_footer(self, out, filename, segments, fps):
+        pass
 
     def generate_shotcut_xml(self, filename, filepath, segments, fps=30):
         """Generate a minimal Shotcut MLT XML (Simplified)"""
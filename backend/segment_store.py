@@ -0,0 +1,119 @@
+"""
+Array-backed speech segments and their server-side store.
+SegmentList keeps start/end times as contiguous float64 arrays instead of a list
+of dicts; SegmentStore saves them as .npy files so exports and re-renders can
+reference segments by id rather than sending the whole list back.
+"""
+import io
+import os
+import re
+import uuid
+
+import numpy as np
+
+NPY_MEDIA_TYPE = "application/x-npy"
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class SegmentList:
+    def __init__(self, starts, ends):
+        self.starts = np.ascontiguousarray(starts, dtype=np.float64)
+        self.ends = np.ascontiguousarray(ends, dtype=np.float64)
+        if self.starts.shape != self.ends.shape or self.starts.ndim != 1:
+            raise ValueError("starts and ends must be 1-D arrays of equal length")
+
+    @classmethod
+    def from_dicts(cls, segments):
+        """From the JSON form: a list of {'start': s, 'end': e} dicts"""
+        starts = np.fromiter((seg['start'] for seg in segments), dtype=np.float64, count=len(segments))
+        ends = np.fromiter((seg['end'] for seg in segments), dtype=np.float64, count=len(segments))
+        return cls(starts, ends)
+
+    @classmethod
+    def from_array(cls, array):
+        """From an [n, 2] array of (start, end) rows"""
+        array = np.asarray(array, dtype=np.float64).reshape(-1, 2)
+        return cls(array[:, 0], array[:, 1])
+
+    @classmethod
+    def from_npy(cls, data):
+        return cls.from_array(np.load(io.BytesIO(data), allow_pickle=False))
+
+    def to_dicts(self):
+        return [{'start': s, 'end': e} for s, e in zip(self.starts.tolist(), self.ends.tolist())]
+
+    def to_array(self):
+        return np.stack([self.starts, self.ends], axis=1)
+
+    def to_npy(self):
+        buffer = io.BytesIO()
+        np.save(buffer, self.to_array(), allow_pickle=False)
+        return buffer.getvalue()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SegmentList(self.starts[index], self.ends[index])
+        return {'start': float(self.starts[index]), 'end': float(self.ends[index])}
+
+    def pairs(self):
+        """(start, end) tuples as Python floats"""
+        return zip(self.starts.tolist(), self.ends.tolist())
+
+    def durations(self):
+        return self.ends - self.starts
+
+    def total_duration(self):
+        return float(self.durations().sum())
+
+    def to_frames(self, fps):
+        """Start/end frame indices (truncated, like the exporters always did)"""
+        return (self.starts * fps).astype(np.int64), (self.ends * fps).astype(np.int64)
+
+
+def as_segment_list(segments):
+    """Accept a SegmentList or the list-of-dicts JSON form"""
+    if isinstance(segments, SegmentList):
+        return segments
+    return SegmentList.from_dicts(segments)
+
+
+class SegmentStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def filename_for(self, segments_id):
+        """Name of the segments file inside the store directory"""
+        if not _ID_PATTERN.match(segments_id):
+            raise KeyError(segments_id)
+        return f"{segments_id}.npy"
+
+    def _path(self, segments_id):
+        return os.path.join(self.directory, self.filename_for(segments_id))
+
+    def put(self, segments, segments_id=None):
+        """Store segments, returning their id"""
+        segments_id = segments_id or uuid.uuid4().hex
+        np.save(self._path(segments_id), as_segment_list(segments).to_array(), allow_pickle=False)
+        return segments_id
+
+    def get(self, segments_id):
+        """Stored segments, or None if the id is unknown"""
+        try:
+            path = self._path(segments_id)
+        except KeyError:
+            return None
+        if not os.path.exists(path):
+            return None
+        return SegmentList.from_array(np.load(path, allow_pickle=False))
+
+    def delete(self, segments_id):
+        try:
+            path = self._path(segments_id)
+        except KeyError:
+            return
+        if os.path.exists(path):
+            os.remove(path)
@@ -2,9 +2,15 @@
 Shotcut MLT XML Project Exporter
 Generates Shotcut-compatible MLT XML files from video segments.
 """
+import io
 import os
+from timeline_writer import TimelineWriter, rational_fps
 
 class ShotcutExporter:
+    format_name = "mlt"
+    extension = ".mlt"
+    media_type = "application/xml"
+
     def __init__(self):
         pass
     
@@ -14,26 +20,32 @@ class ShotcutExporter:
         
         Args:
             video_path: Absolute path to the video file
-            segments: List of dicts with 'start' and 'end' times in seconds
+            segments: SegmentList, or list of dicts with 'start' and 'end' times in seconds
             fps: Frames per second (default 30.0)
         
         Returns:
             MLT XML content as string
         """
-        
+        out = io.StringIO()
+        TimelineWriter([(self, out)]).write(video_path, segments, fps)
+        return out.getvalue()
+
+    def _total_frames(self, segments, fps):
+        # Calculate total duration from segments
+        if len(segments):
+            return int(segments.ends[-1] * fps)
+        return 1000
+
+    def write_header(self, out, video_path, segments, fps):
         # Ensure we have an absolute path with forward slashes
         abs_path = os.path.abspath(video_path).replace('\\', '/')
-        
-        # Calculate total duration from segments
-        if segments:
-            total_frames = int(segments[-1]['end'] * fps)
-        else:
-            total_frames = 1000
+        total_frames = self._total_frames(segments, fps)
+        frame_rate_num, frame_rate_den = rational_fps(fps)
         
         # Build MLT XML with proper Shotcut structure
-        mlt = f'''<?xml version="1.0" encoding="utf-8"?>
+        out.write(f'''<?xml version="1.0" encoding="utf-8"?>
 <mlt LC_NUMERIC="C" version="7.14.0" title="Croppa Project" producer="main_bin">
-  <profile description="automatic" width="1920" height="1080" progressive="1" sample_aspect_num="1" sample_aspect_den="1" display_aspect_num="16" display_aspect_den="9" frame_rate_num="{int(fps)}" frame_rate_den="1" colorspace="709"/>
+  <profile description="automatic" width="1920" height="1080" progressive="1" sample_aspect_num="1" sample_aspect_den="1" display_aspect_num="16" display_aspect_den="9" frame_rate_num="{frame_rate_num}" frame_rate_den="{frame_rate_den}" colorspace="709"/>
   
   <producer id="producer0" in="0" out="{total_frames}">
     <property name="length">{total_frames + 1}</property>
@@ -64,15 +76,16 @@ class ShotcutExporter:
   </playlist>
   
   <playlist id="playlist0">
-'''
-        
-        # Add each segment as an entry
-        for seg in segments:
-            in_frame = int(seg['start'] * fps)
-            out_frame = int(seg['end'] * fps)
-            mlt += f'    <entry producer="producer0" in="{in_frame}" out="{out_frame}"/>\n'
-        
-        mlt += f'''  </playlist>
+''')
+
+    def write_clip(self, out, video_path, index, start, end, record_start, fps):
+        in_frame = int(start * fps)
+        out_frame = int(end * fps)
+        out.write(f'    <entry producer="producer0" in="{in_frame}" out="{out_frame}"/>\n')
+
+    def write_footer(self, out, video_path, segments, fps):
+        total_frames = self._total_frames(segments, fps)
+        out.write(f'''  </playlist>
   
   <playlist id="playlist1"/>
   
@@ -107,6 +120,4 @@ class ShotcutExporter:
     </transition>
   </tractor>
 </mlt>
-'''
-        
-        return mlt
+''')
@@ -0,0 +1,108 @@
+"""
+Streaming timeline export.
+Exporters implement write_header / write_clip / write_footer against a
+file-like object; TimelineWriter drives any number of them through a single
+pass over the segments, so several formats can be written at once straight to
+disk or to an HTTP response without building the documents in memory.
+"""
+import time
+from fractions import Fraction
+from metrics import STAGE_SECONDS, BYTES_WRITTEN
+from segment_store import as_segment_list
+
+# Clips written between yields when streaming
+CHUNK_CLIPS = 1000
+# Lowest frame rate the exporters accept (timecodes need at least one frame per second)
+MIN_FPS = 1
+
+
+def rational_fps(fps):
+    """
+    Exact frame rate as (numerator, denominator): whole rates are n/1 and the
+    NTSC rates (23.976, 29.97, 59.94, ...) are n*1000/1001.
+    """
+    fps = float(fps)
+    if fps < MIN_FPS:
+        raise ValueError(f"Frame rate must be at least {MIN_FPS}: {fps}")
+    if abs(fps - round(fps)) < 0.001:
+        return round(fps), 1
+    nominal = round(fps * 1.001)
+    if abs(fps - nominal / 1.001) < 0.005:
+        return nominal * 1000, 1001
+    fraction = Fraction(fps).limit_denominator(1001)
+    return fraction.numerator, fraction.denominator
+
+
+class CountingWriter:
+    """Wraps a text stream and counts characters written (for metrics)"""
+
+    def __init__(self, out):
+        self._out = out
+        self.count = 0
+
+    def write(self, text):
+        self.count += len(text)
+        self._out.write(text)
+
+
+class ChunkBuffer:
+    """Text sink that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, text):
+        self._parts.append(text)
+
+    def drain(self):
+        text = "".join(self._parts)
+        self._parts = []
+        return text
+
+
+class TimelineWriter:
+    def __init__(self, sinks):
+        """
+        Args:
+            sinks: List of (exporter, out) pairs; each exporter writes to its out
+        """
+        self.sinks = [(exporter, CountingWriter(out)) for exporter, out in sinks]
+
+    def iter_write(self, video_path, segments, fps=30.0):
+        """Write all sinks, yielding every CHUNK_CLIPS clips so callers can flush"""
+        started = time.perf_counter()
+        segments = as_segment_list(segments)
+        for exporter, out in self.sinks:
+            exporter.write_header(out, video_path, segments, fps)
+        yield
+
+        record_start = 0.0
+        for i, (start, end) in enumerate(segments.pairs()):
+            for exporter, out in self.sinks:
+                exporter.write_clip(out, video_path, i, start, end, record_start, fps)
+            record_start += end - start
+            if (i + 1) % CHUNK_CLIPS == 0:
+                yield
+
+        for exporter, out in self.sinks:
+            exporter.write_footer(out, video_path, segments, fps)
+        elapsed = time.perf_counter() - started
+        for exporter, out in self.sinks:
+            stage = f"export_{exporter.format_name}"
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            BYTES_WRITTEN.inc(out.count, stage=stage)
+        yield
+
+    def write(self, video_path, segments, fps=30.0):
+        for _ in self.iter_write(video_path, segments, fps):
+            pass
+
+
+def stream_timeline(exporter, video_path, segments, fps=30.0):
+    """Generator of text chunks of one format, for an HTTP streaming response"""
+    buffer = ChunkBuffer()
+    writer = TimelineWriter([(exporter, buffer)])
+    for _ in writer.iter_write(video_path, segments, fps):
+        chunk = buffer.drain()
+        if chunk:
+            yield chunk
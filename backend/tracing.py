@@ -0,0 +1,98 @@
+"""
+Per-job tracing in Chrome trace format.
+A Tracer records nested spans (start, duration, attributes) which can be loaded
+in chrome://tracing or ui.perfetto.dev. NULL_TRACER is the disabled default:
+its spans are a shared no-op object, so untraced jobs pay only a method call.
+"""
+import os
+import threading
+import time
+
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self._tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self._start = None
+
+    def set(self, key, value):
+        self.attrs[key] = value
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        self._tracer._record(self.name, self._start, end, self.attrs)
+        return False
+
+
+class _NullSpan:
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    enabled = True
+
+    def __init__(self, name="croppa"):
+        self.name = name
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._events = []
+
+    def span(self, name, **attrs):
+        """Context manager timing a block; nested spans nest by timestamp"""
+        return Span(self, name, attrs)
+
+    def _record(self, name, start, end, attrs):
+        event = {
+            "name": name,
+            "cat": "croppa",
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": attrs,
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def to_chrome_trace(self):
+        """Trace as a Chrome/Perfetto JSON object"""
+        with self._lock:
+            events = list(self._events)
+        metadata = {
+            "name": "process_name",
+            "ph": "M",
+            "pid": os.getpid(),
+            "args": {"name": self.name},
+        }
+        return {"traceEvents": [metadata] + events, "displayTimeUnit": "ms"}
+
+
+class _NullTracer:
+    enabled = False
+
+    def span(self, name, **attrs):
+        return _NULL_SPAN
+
+    def to_chrome_trace(self):
+        return {"traceEvents": []}
+
+
+NULL_TRACER = _NullTracer()
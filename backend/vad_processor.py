@@ -1,19 +1,37 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import torch
 import torchaudio
 import numpy as np
+from metrics import STAGE_SECONDS, BYTES_READ, file_size
+from tracing import NULL_TRACER
+from waveform import build_levels, save_pyramid
+
+# Upper bound on padded samples per device pass (float32: 4 bytes each)
+MAX_BATCH_SAMPLES = 64 * 1024 * 1024
 
 class VADProcessor:
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"VADProcessor initialized on device: {self.device}")
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
     def is_gpu_available(self):
         return torch.cuda.is_available()
 
-    def get_speech_timestamps(self, audio_path, threshold=-40.0, min_silence_duration=0.5, padding=0.25):
-        """
-        Detects 'active' audio segments based on RMS energy threshold (dB) using PyTorch (GPU).
-        """
+    @property
+    def executor(self):
+        """Shared thread pool for audio loading, created once and kept warm"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                                    thread_name_prefix="croppa-vad")
+            return self._executor
+
+    def _load_audio(self, audio_path):
+        """Load audio as a [channels, samples] float tensor on the CPU"""
         # Force soundfile backend for Windows compatibility
         try:
             if torchaudio.get_audio_backend() != 'soundfile':
@@ -28,92 +46,175 @@ class VADProcessor:
                 wav = wav.unsqueeze(0) # Add channel dim [1, samples]
             else:
                 wav = wav.t() # [samples, channels] -> [channels, samples]
+        return wav, sr
+
+    def _load_mono(self, audio_path):
+        wav, sr = self._load_audio(audio_path)
+        return wav.mean(dim=0) if wav.shape[0] > 1 else wav.squeeze(0), sr
+
+    def get_speech_timestamps(self, audio_path, threshold=-40.0, min_silence_duration=0.5, padding=0.25,
+                              tracer=NULL_TRACER, waveform_dir=None):
+        """
+        Detects 'active' audio segments based on RMS energy threshold (dB) using PyTorch (GPU).
+        If waveform_dir is given, the min/max/RMS envelope pyramid of the same
+        10ms windows is saved there for the timeline UI.
+        """
+        with STAGE_SECONDS.time(stage="vad"), tracer.span("vad", path=audio_path):
+            segments = self._detect_segments(audio_path, threshold, min_silence_duration, padding, tracer,
+                                             waveform_dir)
+        BYTES_READ.inc(file_size(audio_path), stage="vad")
+        return segments
+
+    def _detect_segments(self, audio_path, threshold, min_silence_duration, padding, tracer, waveform_dir=None):
+        with tracer.span("load_tensor", device=str(self.device)) as span:
+            wav, sr = self._load_audio(audio_path)
+            
+            # Move to GPU if available
+            wav = wav.to(self.device)
+            span.set("samples", int(wav.shape[-1]))
+            span.set("sample_rate", sr)
         
-        # Move to GPU if available
-        wav = wav.to(self.device)
-        
-        # Convert to mono if stereo (average channels)
-        if wav.shape[0] > 1:
-            wav = wav.mean(dim=0)
-        else:
-            wav = wav.squeeze()
+        with tracer.span("rms"):
+            # Convert to mono if stereo (average channels)
+            if wav.shape[0] > 1:
+                wav = wav.mean(dim=0)
+            else:
+                wav = wav.squeeze()
+            num_samples = wav.shape[0]
             
-        # Calculate window size (e.g. 10ms windows)
-        window_size = int(0.01 * sr)
+            # Calculate window size (e.g. 10ms windows)
+            window_size = int(0.01 * sr)
         
-        # Pad wav to be divisible by window_size
-        pad_length = window_size - (wav.shape[0] % window_size)
-        if pad_length != window_size:
-            wav = torch.nn.functional.pad(wav, (0, pad_length))
+            # Pad wav to be divisible by window_size
+            pad_length = window_size - (wav.shape[0] % window_size)
+            if pad_length != window_size:
+                wav = torch.nn.functional.pad(wav, (0, pad_length))
             
-        # Reshape into windows: [num_windows, window_size]
-        windows = wav.view(-1, window_size)
+            # Reshape into windows: [num_windows, window_size]
+            windows = wav.view(-1, window_size)
         
-        # Calculate RMS: sqrt(mean(square(signal)))
-        # square
-        squared = windows.pow(2)
-        # mean
-        means = squared.mean(dim=1)
-        # sqrt
-        rms_values = torch.sqrt(means)
+            # Calculate RMS: sqrt(mean(square(signal)))
+            # square
+            squared = windows.pow(2)
+            # mean
+            means = squared.mean(dim=1)
+            # sqrt
+            rms_values = torch.sqrt(means)
         
-        # Convert to dB: 20 * log10(rms)
-        # Avoid log(0)
-        epsilon = 1e-10
-        db_values = 20 * torch.log10(rms_values + epsilon)
+            # Convert to dB: 20 * log10(rms)
+            # Avoid log(0)
+            epsilon = 1e-10
+            db_values = 20 * torch.log10(rms_values + epsilon)
         
-        # Determine active windows
-        # threshold is in dB (e.g. -40)
-        is_active_tensor = db_values > threshold
+            # Determine active windows
+            # threshold is in dB (e.g. -40)
+            is_active_tensor = db_values > threshold
         
-        # Move result back to CPU for list processing
-        is_active = is_active_tensor.cpu().numpy()
+            # Move result back to CPU for list processing
+            is_active = is_active_tensor.cpu().numpy()
         
-        # Convert window indices to time segments
-        active_segments = []
-        start_window = None
+        if waveform_dir is not None:
+            with tracer.span("waveform", windows=len(is_active)):
+                levels = build_levels(
+                    windows.amin(dim=1).cpu().numpy(),
+                    windows.amax(dim=1).cpu().numpy(),
+                    rms_values.cpu().numpy(),
+                )
+                save_pyramid(waveform_dir, levels, 0.01, num_samples / sr)
         
-        for i, active in enumerate(is_active):
-            if active:
-                if start_window is None:
-                    start_window = i
-            else:
-                if start_window is not None:
-                    active_segments.append({
-                        'start': start_window * 0.01,
-                        'end': i * 0.01
-                    })
-                    start_window = None
-                    
-        if start_window is not None:
-            active_segments.append({
-                'start': start_window * 0.01,
-                'end': len(is_active) * 0.01
-            })
+        with tracer.span("segmentation", windows=len(is_active)):
+            return self._segments_from_activity(is_active, len(wav) / sr, min_silence_duration, padding)
+
+    def get_speech_timestamps_batch(self, audio_paths, threshold=-40.0, min_silence_duration=0.5, padding=0.25,
+                                    tracer=NULL_TRACER):
+        """
+        Batched get_speech_timestamps for many (typically short) files.
+        Files are loaded on the shared thread pool, packed into one zero-padded
+        [files, samples] tensor per sample rate and analysed in a single device
+        pass; each file's valid windows come from its length.
+        
+        Returns:
+            List of segment lists, in the order of audio_paths
+        """
+        with STAGE_SECONDS.time(stage="vad_batch"), tracer.span("vad_batch", files=len(audio_paths)):
+            with tracer.span("load_tensor", files=len(audio_paths)):
+                loaded = list(self.executor.map(self._load_mono, audio_paths))
             
-        # Merge segments
-        if not active_segments:
-            return []
+            results = [None] * len(audio_paths)
+            by_rate = {}
+            for index, (wav, sr) in enumerate(loaded):
+                by_rate.setdefault(sr, []).append(index)
             
-        merged = []
-        current = active_segments[0]
+            for sr, indices in by_rate.items():
+                window_size = int(0.01 * sr)
+                # Similar lengths together keeps padding waste low
+                indices.sort(key=lambda i: loaded[i][0].shape[0])
+                for group in self._pack_groups(indices, loaded, window_size):
+                    self._analyze_group(group, loaded, sr, window_size, threshold,
+                                        min_silence_duration, padding, results, tracer)
         
-        for next_seg in active_segments[1:]:
-            gap = next_seg['start'] - current['end']
-            if gap < min_silence_duration:
-                current['end'] = next_seg['end']
-            else:
-                merged.append(current)
-                current = next_seg
-        merged.append(current)
-        
-        # Apply padding
-        final_segments = []
-        duration = len(wav) / sr
+        for path in audio_paths:
+            BYTES_READ.inc(file_size(path), stage="vad")
+        return results
+
+    def _pack_groups(self, indices, loaded, window_size):
+        """Split length-sorted files into groups whose padded batch fits MAX_BATCH_SAMPLES"""
+        group = []
+        for index in indices:
+            length = -(-loaded[index][0].shape[0] // window_size) * window_size
+            # Sorted ascending, so this file sets the padded length of the group
+            if group and length * (len(group) + 1) > MAX_BATCH_SAMPLES:
+                yield group
+                group = []
+            group.append(index)
+        if group:
+            yield group
+
+    def _analyze_group(self, group, loaded, sr, window_size, threshold, min_silence_duration, padding,
+                       results, tracer):
+        lengths = [loaded[i][0].shape[0] for i in group]
+        num_windows = [-(-n // window_size) for n in lengths]
+        max_windows = max(max(num_windows), 1)
         
-        for seg in merged:
-            start = max(0, seg['start'] - padding)
-            end = min(duration, seg['end'] + padding)
-            final_segments.append({'start': start, 'end': end})
+        with tracer.span("rms", files=len(group), windows=max_windows):
+            # Pack into one zero-padded tensor; padding windows are silent
+            batch = torch.zeros((len(group), max_windows * window_size), dtype=torch.float32)
+            for row, index in enumerate(group):
+                batch[row, :lengths[row]] = loaded[index][0]
+            batch = batch.to(self.device)
             
-        return final_segments
+            windows = batch.view(len(group), max_windows, window_size)
+            rms_values = torch.sqrt(windows.pow(2).mean(dim=2))
+            db_values = 20 * torch.log10(rms_values + 1e-10)
+            is_active = (db_values > threshold).cpu().numpy()
+        
+        with tracer.span("segmentation", files=len(group)):
+            for row, index in enumerate(group):
+                # Length mask: only this file's windows count
+                results[index] = self._segments_from_activity(
+                    is_active[row, :num_windows[row]],
+                    num_windows[row] * window_size / sr,
+                    min_silence_duration,
+                    padding
+                )
+
+    def _segments_from_activity(self, is_active, duration, min_silence_duration, padding):
+        """Turn per-window activity flags into merged, padded segments"""
+        # Runs of active windows: +1 where a run starts, -1 where it ends
+        flags = np.concatenate(([0], np.asarray(is_active, dtype=np.int8), [0]))
+        edges = np.diff(flags)
+        starts = np.flatnonzero(edges == 1) * 0.01
+        ends = np.flatnonzero(edges == -1) * 0.01
+        if len(starts) == 0:
+            return []
+        
+        # Merge segments separated by less than min_silence_duration
+        keep = (starts[1:] - ends[:-1]) >= min_silence_duration
+        merged_starts = starts[np.concatenate(([True], keep))]
+        merged_ends = ends[np.concatenate((keep, [True]))]
+        
+        # Apply padding
+        final_starts = np.maximum(merged_starts - padding, 0.0)
+        final_ends = np.minimum(merged_ends + padding, duration)
+        return [{'start': start, 'end': end}
+                for start, end in zip(final_starts.tolist(), final_ends.tolist())]
@@ -1,9 +1,20 @@
 import ffmpeg
+import errno
 import os
 import sys
 import re
 import subprocess
 import shutil
+import tempfile
+import time
+from metrics import (STAGE_SECONDS, ENCODE_SPEED, BYTES_READ, BYTES_WRITTEN,
+                     ENCODER_SELECTED, CACHE_REQUESTS, file_size)
+from tracing import NULL_TRACER
+from segment_store import as_segment_list
+
+def _is_closed_pipe(error):
+    """Writing to a process that already exited: EPIPE, or EINVAL on Windows"""
+    return isinstance(error, BrokenPipeError) or error.errno == errno.EINVAL
 
 class VideoEditor:
     def __init__(self):
@@ -55,6 +66,34 @@ class VideoEditor:
             self.ffprobe_bin = "ffprobe"
             
         print(f"Using FFmpeg binary: {self.ffmpeg_bin}")
+
+        # Result of the h264_nvenc probe, filled on first render
+        self._has_gpu = None
+
+    def has_gpu_encoder(self):
+        """Check (once) whether FFmpeg was built with the NVENC encoder"""
+        if self._has_gpu is not None:
+            CACHE_REQUESTS.inc(cache="encoder_probe", result="hit")
+            return self._has_gpu
+        CACHE_REQUESTS.inc(cache="encoder_probe", result="miss")
+
+        has_gpu = False
+        try:
+            result = subprocess.run([self.ffmpeg_bin, '-hide_banner', '-encoders'], capture_output=True, text=True)
+            if 'h264_nvenc' in result.stdout:
+                has_gpu = True
+                print("NVIDIA GPU detected. Using h264_nvenc.")
+        except:
+            pass
+        self._has_gpu = has_gpu
+        return has_gpu
+
+    def _run_ffmpeg(self, cmd, tracer, span_name, **attrs):
+        """Run an FFmpeg command, recording argv length and exit code in the trace"""
+        with tracer.span(span_name, argv_len=len(cmd), **attrs) as span:
+            process = subprocess.run(cmd, capture_output=True, text=True)
+            span.set("exit_code", process.returncode)
+        return process
     
     def get_duration(self, video_path):
         try:
@@ -63,48 +102,121 @@ class VideoEditor:
         except:
             return 0.0
 
-    def extract_audio(self, video_path, audio_path):
-        try:
-            print(f"Extracting audio from {video_path} to {audio_path}")
-            (
-                ffmpeg
-                .input(video_path)
-                .output(audio_path, ac=1, ar=16000)
-                .overwrite_output()
-                .run(cmd=self.ffmpeg_bin, capture_stdout=True, capture_stderr=True)
-            )
-        except ffmpeg.Error as e:
-            print(f"FFmpeg error: {e.stderr.decode()}")
-            raise e
+    def extract_audio(self, video_path, audio_path, tracer=NULL_TRACER):
+        print(f"Extracting audio from {video_path} to {audio_path}")
+        cmd = (
+            ffmpeg
+            .input(video_path)
+            .output(audio_path, ac=1, ar=16000)
+            .overwrite_output()
+            .compile(cmd=self.ffmpeg_bin)
+        )
+        with STAGE_SECONDS.time(stage="extract_audio"):
+            process = self._run_ffmpeg(cmd, tracer, "extract_audio")
+        if process.returncode != 0:
+            print(f"FFmpeg error: {process.stderr}")
+            raise Exception(f"Audio extraction failed: {process.stderr}")
+        BYTES_READ.inc(file_size(video_path), stage="extract_audio")
+        BYTES_WRITTEN.inc(file_size(audio_path), stage="extract_audio")
+
+    def _batch_command(self, video_path, batch, has_gpu, video_crf, video_cq, video_preset, audio_bitrate,
+                       scale_height=None, x264_preset='medium'):
+        """FFmpeg command (minus the output file) rendering one batch with trim+concat"""
+        # Construct filter complex for this batch
+        filter_complex = ""
+        concat_inputs = ""
+        
+        if scale_height:
+            # Scale once, before the trims, so every filter after it works on small frames
+            split_outputs = "".join(f"[s{j}]" for j in range(len(batch)))
+            filter_complex += f"[0:v]scale=-2:{scale_height},split={len(batch)}{split_outputs};"
+        
+        for j, (seg_start, seg_end) in enumerate(batch.pairs()):
+            start = f"{seg_start:.4f}"
+            end = f"{seg_end:.4f}"
+            video_input = f"[s{j}]" if scale_height else "[0:v]"
+            
+            # Video trim
+            filter_complex += f"{video_input}trim=start={start}:end={end},setpts=PTS-STARTPTS[v{j}];"
+            
+            # Audio trim
+            filter_complex += f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{j}];"
+            
+            # Interleave inputs for concat: [v0][a0][v1][a1]...
+            concat_inputs += f"[v{j}][a{j}]"
+        
+        # Concat filter for this batch
+        filter_complex += f"{concat_inputs}concat=n={len(batch)}:v=1:a=1[outv][outa]"
+        
+        cmd = [
+            self.ffmpeg_bin,
+            '-y',
+            '-i', video_path,
+            '-filter_complex', filter_complex,
+            '-map', '[outv]',
+            '-map', '[outa]'
+        ]
+        
+        # Encoding settings (configurable)
+        if has_gpu:
+            cmd.extend(['-c:v', 'h264_nvenc', '-preset', video_preset, '-rc', 'vbr_hq', '-cq', str(video_cq), '-b:v', '0'])
+        else:
+            cmd.extend(['-c:v', 'libx264', '-preset', x264_preset, '-crf', str(video_crf)])
+        
+        cmd.extend(['-c:a', 'aac', '-b:a', f'{audio_bitrate}k'])
+        return cmd
+
+    def _encode_batch(self, cmd, index, batch, encoder, input_size, output_file, tracer,
+                      stage="batch_encode"):
+        """Run one batch command and record its metrics under `stage` and `encoder`"""
+        batch_start = time.perf_counter()
+        process = self._run_ffmpeg(cmd, tracer, "encode_batch", batch=index, segments=len(batch))
+        if process.returncode != 0:
+            raise Exception(f"Batch {index} failed: {process.stderr}")
+        elapsed = time.perf_counter() - batch_start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+
+        # Every batch decodes the whole input; media time is the kept duration
+        media_seconds = batch.total_duration()
+        if elapsed > 0:
+            ENCODE_SPEED.observe(media_seconds / elapsed, encoder=encoder)
+        BYTES_READ.inc(input_size, stage=stage)
+        BYTES_WRITTEN.inc(file_size(output_file), stage=stage)
 
     def cut_video(self, video_path, output_path, segments, progress_callback=None,
-                  batch_size=15, video_crf=18, video_cq=19, video_preset='p4', audio_bitrate=192):
+                  batch_size=15, video_crf=18, video_cq=19, video_preset='p4', audio_bitrate=192,
+                  tracer=NULL_TRACER, scale_height=None, x264_preset='medium', profile=None):
         """
         Cuts video using Batched Filter Processing.
         Groups segments into batches and processes them with trim+concat filters.
         This ensures perfect sync (trim filter), avoids crashes (short cmds), 
         and reduces GPU spikes (fewer processes).
+        Segments may be a SegmentList or a list of {'start', 'end'} dicts.
+        scale_height downscales the video (keeping aspect) before trimming.
+        profile (e.g. "proxy") prefixes the stage labels and suffixes the encoder
+        label of the recorded metrics, so they stay apart from full renders.
         """
-        if not segments:
-            shutil.copy2(video_path, output_path)
+        segments = as_segment_list(segments)
+        if not len(segments):
+            with tempfile.TemporaryDirectory(prefix="temp_output_", dir=os.path.dirname(output_path) or ".") as partial_dir:
+                partial_path = os.path.join(partial_dir, os.path.basename(output_path))
+                shutil.copy2(video_path, partial_path)
+                os.replace(partial_path, output_path)
             return 0, 0
 
-        original_duration = self.get_duration(video_path)
+        with tracer.span("probe", path=video_path):
+            original_duration = self.get_duration(video_path)
         
         # Check for GPU
-        has_gpu = False
-        try:
-            result = subprocess.run([self.ffmpeg_bin, '-hide_banner', '-encoders'], capture_output=True, text=True)
-            if 'h264_nvenc' in result.stdout:
-                has_gpu = True
-                print("NVIDIA GPU detected. Using h264_nvenc.")
-        except:
-            pass
+        has_gpu = self.has_gpu_encoder()
+        encoder = 'h264_nvenc' if has_gpu else 'libx264'
+        encoder_label = f"{encoder}_{profile}" if profile else encoder
+        stage_prefix = f"{profile}_" if profile else ""
+        ENCODER_SELECTED.inc(encoder=encoder_label)
+        input_size = file_size(video_path)
 
-        temp_dir = os.path.join(os.path.dirname(output_path), "temp_batches")
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
-        os.makedirs(temp_dir, exist_ok=True)
+        # Unique per render so parallel jobs can share an output folder
+        temp_dir = tempfile.mkdtemp(prefix="temp_batches_", dir=os.path.dirname(output_path) or ".")
 
         try:
             # Group segments into batches
@@ -120,56 +232,20 @@ class VideoEditor:
                 
                 print(f"Processing Batch {i+1}/{total_batches} ({len(batch)} segments)...")
                 
-                # Construct filter complex for this batch
-                filter_complex = ""
-                concat_inputs = ""
-                
-                for j, seg in enumerate(batch):
-                    start = f"{seg['start']:.4f}"
-                    end = f"{seg['end']:.4f}"
-                    
-                    # Video trim
-                    filter_complex += f"[0:v]trim=start={start}:end={end},setpts=PTS-STARTPTS[v{j}];"
-                    
-                    # Audio trim
-                    filter_complex += f"[0:a]atrim=start={start}:end={end},asetpts=PTS-STARTPTS[a{j}];"
-                    
-                    # Interleave inputs for concat: [v0][a0][v1][a1]...
-                    concat_inputs += f"[v{j}][a{j}]"
-                
-                # Concat filter for this batch
-                filter_complex += f"{concat_inputs}concat=n={len(batch)}:v=1:a=1[outv][outa]"
-                
-                cmd = [
-                    self.ffmpeg_bin,
-                    '-y',
-                    '-i', video_path,
-                    '-filter_complex', filter_complex,
-                    '-map', '[outv]',
-                    '-map', '[outa]'
-                ]
-                
-                # Encoding settings (configurable)
-                if has_gpu:
-                    cmd.extend(['-c:v', 'h264_nvenc', '-preset', video_preset, '-rc', 'vbr_hq', '-cq', str(video_cq), '-b:v', '0'])
-                else:
-                    cmd.extend(['-c:v', 'libx264', '-preset', 'medium', '-crf', str(video_crf)])
-                
-                cmd.extend(['-c:a', 'aac', '-b:a', f'{audio_bitrate}k'])
+                cmd = self._batch_command(video_path, batch, has_gpu, video_crf, video_cq,
+                                          video_preset, audio_bitrate, scale_height, x264_preset)
                 cmd.append(batch_filename)
-                
-                # Run batch
-                process = subprocess.run(cmd, capture_output=True, text=True)
-                if process.returncode != 0:
-                    raise Exception(f"Batch {i} failed: {process.stderr}")
+                self._encode_batch(cmd, i, batch, encoder_label, input_size, batch_filename, tracer,
+                                   stage=f"{stage_prefix}batch_encode")
                 
                 # Update progress
                 if progress_callback:
                     percent = int(((i + 1) / total_batches) * 90) # 0-90% for batches
                     progress_callback(percent)
 
-            # Final Concat of batches
+            # Final Concat of batches, next to the batches; moved into place only once complete
             print("Concatenating batches...")
+            partial_path = os.path.join(temp_dir, os.path.basename(output_path))
             concat_list_path = os.path.join(temp_dir, "concat_list.txt")
             with open(concat_list_path, 'w') as f:
                 for bf in batch_files:
@@ -184,18 +260,23 @@ class VideoEditor:
                 '-safe', '0',
                 '-i', concat_list_path,
                 '-c', 'copy', # Stream copy for instant merge
-                output_path
+                partial_path
             ]
             
             # Run final concat with error capturing
-            process = subprocess.run(cmd, capture_output=True, text=True)
+            with STAGE_SECONDS.time(stage=f"{stage_prefix}concat"):
+                process = self._run_ffmpeg(cmd, tracer, "concat", batches=len(batch_files))
             if process.returncode != 0:
                 raise Exception(f"Final concat failed: {process.stderr}")
+            os.replace(partial_path, output_path)
+            BYTES_READ.inc(sum(file_size(bf) for bf in batch_files), stage=f"{stage_prefix}concat")
+            BYTES_WRITTEN.inc(file_size(output_path), stage=f"{stage_prefix}concat")
             
             if progress_callback:
                 progress_callback(100)
 
-            final_duration = self.get_duration(output_path)
+            with tracer.span("probe", path=output_path):
+                final_duration = self.get_duration(output_path)
             return original_duration, final_duration
 
         except Exception as e:
@@ -208,3 +289,247 @@ class VideoEditor:
                     shutil.rmtree(temp_dir)
             except Exception as cleanup_error:
                 print(f"Warning: Failed to clean up temp directory: {cleanup_error}")
+
+    def render_proxy(self, video_path, output_path, segments, progress_callback=None,
+                     height=360, batch_size=15, tracer=NULL_TRACER):
+        """
+        Fast low-resolution preview of the cut: downscaled to `height` early in
+        the filter graph, fastest encoder presets, lower quality and bitrate.
+        """
+        with tracer.span("proxy", height=height):
+            return self.cut_video(
+                video_path,
+                output_path,
+                segments,
+                progress_callback=progress_callback,
+                batch_size=batch_size,
+                video_crf=28,
+                video_cq=32,
+                video_preset='p1',
+                audio_bitrate=96,
+                tracer=tracer,
+                scale_height=height,
+                x264_preset='ultrafast',
+                profile='proxy'
+            )
+
+    def cut_video_hls(self, video_path, stream_dir, segments, progress_callback=None,
+                      batch_size=15, video_crf=18, video_cq=19, video_preset='p4', audio_bitrate=192,
+                      tracer=NULL_TRACER):
+        """
+        Progressive variant of cut_video: every batch is encoded straight to an
+        MPEG-TS segment and appended to an HLS EVENT playlist (index.m3u8) as
+        soon as it finishes, so playback/download can start with the first
+        batch. Timestamps are offset to run continuously across segments and
+        there is no final concat pass.
+        
+        Returns:
+            (original_duration, final_duration) where final_duration is the
+            total kept duration
+        """
+        segments = as_segment_list(segments)
+        os.makedirs(stream_dir, exist_ok=True)
+        playlist_path = os.path.join(stream_dir, HLS_PLAYLIST)
+
+        with tracer.span("probe", path=video_path):
+            original_duration = self.get_duration(video_path)
+        if not len(segments):
+            # Nothing detected: stream the whole video as one segment
+            segments = as_segment_list([{'start': 0.0, 'end': original_duration}])
+
+        has_gpu = self.has_gpu_encoder()
+        encoder = 'h264_nvenc' if has_gpu else 'libx264'
+        ENCODER_SELECTED.inc(encoder=encoder)
+        input_size = file_size(video_path)
+
+        batches = [segments[i:i + batch_size] for i in range(0, len(segments), batch_size)]
+        durations = [batch.total_duration() for batch in batches]
+        header = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{int(-(-max(durations) // 1))}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        entries = []
+
+        def write_playlist(ended=False):
+            # Replace atomically so readers never see a half-written playlist
+            tmp_path = playlist_path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                f.write("\n".join(header + entries + (["#EXT-X-ENDLIST"] if ended else [])) + "\n")
+            os.replace(tmp_path, playlist_path)
+
+        write_playlist()
+        print(f"Streaming {len(segments)} segments in {len(batches)} HLS batches to {stream_dir}...")
+
+        offset = 0.0
+        for i, batch in enumerate(batches):
+            segment_name = f"seg_{i:03d}.ts"
+            segment_path = os.path.join(stream_dir, segment_name)
+            cmd = self._batch_command(video_path, batch, has_gpu, video_crf, video_cq,
+                                      video_preset, audio_bitrate)
+            cmd.extend(['-output_ts_offset', f"{offset:.4f}", '-f', 'mpegts', segment_path])
+            self._encode_batch(cmd, i, batch, encoder, input_size, segment_path, tracer)
+
+            entries.extend([f"#EXTINF:{durations[i]:.3f},", segment_name])
+            write_playlist()
+            offset += durations[i]
+
+            if progress_callback:
+                progress_callback(int(((i + 1) / len(batches)) * 100))
+
+        write_playlist(ended=True)
+        return original_duration, offset
+
+    def get_audio_layout(self, video_path):
+        """(sample_rate, channels) of the first audio stream, with safe defaults"""
+        try:
+            probe = ffmpeg.probe(video_path, cmd=self.ffprobe_bin, select_streams='a:0')
+            stream = probe['streams'][0]
+            return int(stream['sample_rate']), min(int(stream['channels']), 2)
+        except:
+            return 48000, 2
+
+    def cut_audio(self, video_path, output_path, segments, progress_callback=None,
+                  audio_format=None, audio_bitrate=192, tracer=NULL_TRACER):
+        """
+        Audio-only cut: skips the video stream entirely.
+        The audio is decoded once to raw PCM, the kept sample ranges are sliced
+        out of the stream (sample-accurate, no filter graph) and piped straight
+        into the encoder. audio_format is 'm4a', 'opus' or 'wav' (default: from
+        the output extension).
+        """
+        segments = as_segment_list(segments)
+        audio_format = audio_format or os.path.splitext(output_path)[1].lstrip('.').lower()
+        if audio_format not in AUDIO_CODECS:
+            raise ValueError(f"Unsupported audio format: {audio_format}")
+
+        with tracer.span("probe", path=video_path):
+            original_duration = self.get_duration(video_path)
+            sample_rate, channels = self.get_audio_layout(video_path)
+        frame_bytes = 4 * channels  # f32le
+
+        # Kept ranges in samples; overlapping padded segments are clipped, not repeated
+        ranges = []
+        for start, end in segments.pairs():
+            first = int(round(start * sample_rate))
+            last = int(round(end * sample_rate))
+            if ranges and first < ranges[-1][1]:
+                first = ranges[-1][1]
+            if last > first:
+                ranges.append((first, last))
+        if not len(segments):
+            # Nothing detected: keep the whole track, like cut_video does
+            ranges = [(0, sys.maxsize)]
+            total_samples = int(original_duration * sample_rate)
+        else:
+            # 0 if every segment was empty
+            total_samples = ranges[-1][1] if ranges else 0
+
+        decode_cmd = [
+            self.ffmpeg_bin, '-v', 'error', '-i', video_path,
+            '-map', '0:a:0', '-vn', '-f', 'f32le', '-ac', str(channels), '-ar', str(sample_rate), 'pipe:1'
+        ]
+        encode_cmd = [
+            self.ffmpeg_bin, '-y', '-v', 'error',
+            '-f', 'f32le', '-ac', str(channels), '-ar', str(sample_rate), '-i', 'pipe:0'
+        ]
+        encode_cmd.extend(AUDIO_CODECS[audio_format](audio_bitrate))
+
+        started = time.perf_counter()
+        # stderr goes to temp files so a chatty FFmpeg can never fill a pipe and stall us;
+        # the output is written next to its destination and moved into place once complete
+        with tempfile.TemporaryFile() as decode_err, tempfile.TemporaryFile() as encode_err, \
+                tempfile.TemporaryDirectory(prefix="temp_output_", dir=os.path.dirname(output_path) or ".") as partial_dir, \
+                tracer.span("cut_audio", argv_len=len(encode_cmd) + 1, segments=len(ranges)) as span:
+            partial_path = os.path.join(partial_dir, os.path.basename(output_path))
+            encode_cmd.append(partial_path)
+            decoder = subprocess.Popen(decode_cmd, stdout=subprocess.PIPE, stderr=decode_err)
+            encoder = subprocess.Popen(encode_cmd, stdin=subprocess.PIPE, stderr=encode_err)
+            encoder_gone = False
+            try:
+                position = 0  # Sample index of the start of the current chunk
+                next_range = 0
+                chunk_size = sample_rate * frame_bytes  # ~1 second per read
+                last_percent = -1
+                while next_range < len(ranges):
+                    chunk = decoder.stdout.read(chunk_size)
+                    if not chunk:
+                        break
+                    view = memoryview(chunk)
+                    chunk_end = position + len(chunk) // frame_bytes
+                    # Write every kept range overlapping this chunk
+                    i = next_range
+                    while i < len(ranges) and ranges[i][0] < chunk_end:
+                        first = max(ranges[i][0], position)
+                        last = min(ranges[i][1], chunk_end)
+                        encoder.stdin.write(view[(first - position) * frame_bytes:(last - position) * frame_bytes])
+                        if ranges[i][1] <= chunk_end:
+                            i += 1
+                        else:
+                            break
+                    next_range = i
+                    position = chunk_end
+
+                    if progress_callback and total_samples:
+                        percent = min(99, int(position / total_samples * 100))
+                        if percent != last_percent:
+                            progress_callback(percent)
+                            last_percent = percent
+            except OSError as e:
+                if not _is_closed_pipe(e):
+                    raise
+                # The encoder exited early (bad arguments, missing codec); its stderr says why
+                encoder_gone = True
+            finally:
+                # Nothing after the last kept range is needed
+                if decoder.poll() is None:
+                    decoder.kill()
+                decoder.stdout.close()
+                decoder.wait()
+                try:
+                    encoder.stdin.close()
+                except OSError as e:
+                    if not _is_closed_pipe(e):
+                        raise
+                    encoder_gone = True
+                finally:
+                    encoder.wait()
+            span.set("exit_code", encoder.returncode)
+
+            if encoder.returncode != 0 or encoder_gone:
+                encode_err.seek(0)
+                raise Exception(f"Audio encode failed (exit code {encoder.returncode}): "
+                                f"{encode_err.read().decode(errors='replace')}")
+            if next_range < len(ranges) and decoder.returncode not in (0, None):
+                # e.g. no audio stream: don't publish a truncated (or empty) file
+                decode_err.seek(0)
+                raise Exception(f"Audio decode failed (exit code {decoder.returncode}): "
+                                f"{decode_err.read().decode(errors='replace')}")
+            os.replace(partial_path, output_path)
+
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage="cut_audio")
+        if elapsed > 0:
+            ENCODE_SPEED.observe(segments.total_duration() / elapsed, encoder=AUDIO_ENCODER_NAMES[audio_format])
+        BYTES_READ.inc(file_size(video_path), stage="cut_audio")
+        BYTES_WRITTEN.inc(file_size(output_path), stage="cut_audio")
+
+        if progress_callback:
+            progress_callback(100)
+
+        with tracer.span("probe", path=output_path):
+            final_duration = self.get_duration(output_path)
+        return original_duration, final_duration
+
+
+HLS_PLAYLIST = "index.m3u8"
+
+# Encoder arguments per audio-only output format
+AUDIO_CODECS = {
+    'm4a': lambda bitrate: ['-c:a', 'aac', '-b:a', f'{bitrate}k', '-movflags', '+faststart'],
+    'opus': lambda bitrate: ['-c:a', 'libopus', '-b:a', f'{bitrate}k'],
+    'wav': lambda bitrate: ['-c:a', 'pcm_s16le'],
+}
+AUDIO_ENCODER_NAMES = {'m4a': 'aac', 'opus': 'libopus', 'wav': 'pcm_s16le'}
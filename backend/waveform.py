@@ -0,0 +1,96 @@
+"""
+Multi-resolution waveform envelopes for the timeline UI.
+Level 0 holds min/max/RMS for every 10 ms VAD window; each further level merges
+LEVEL_FACTOR windows of the one below. Levels are stored as raw int16 arrays
+(one file per level, [windows, 3]) so tiles are read with a memmap slice.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+LEVEL_FACTOR = 4
+MIN_LEVEL_WINDOWS = 256  # Stop adding levels once a level is this small
+SCALE = 32767  # Samples are in [-1, 1]; stored as int16
+
+
+def _reduce(level):
+    """Merge LEVEL_FACTOR adjacent windows: min of mins, max of maxes, RMS of RMS"""
+    n = len(level)
+    pad = (-n) % LEVEL_FACTOR
+    if pad:
+        level = np.concatenate([level, np.repeat(level[-1:], pad, axis=0)])
+    grouped = level.reshape(-1, LEVEL_FACTOR, 3)
+    return np.stack([
+        grouped[:, :, 0].min(axis=1),
+        grouped[:, :, 1].max(axis=1),
+        np.sqrt((grouped[:, :, 2] ** 2).mean(axis=1)),
+    ], axis=1)
+
+
+def build_levels(mins, maxs, rms):
+    """Float32 pyramid levels from per-window min/max/RMS arrays"""
+    level = np.stack([mins, maxs, rms], axis=1).astype(np.float32)
+    levels = [level]
+    while len(level) > MIN_LEVEL_WINDOWS:
+        level = _reduce(level)
+        levels.append(level)
+    return levels
+
+
+def save_pyramid(directory, levels, window_seconds, duration):
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.makedirs(directory)
+    for i, level in enumerate(levels):
+        quantized = np.clip(np.round(level * SCALE), -SCALE, SCALE).astype("<i2")
+        quantized.tofile(os.path.join(directory, f"level_{i}.bin"))
+    meta = {
+        "window_seconds": window_seconds,
+        "level_factor": LEVEL_FACTOR,
+        "duration": duration,
+        "scale": SCALE,
+        "channels": ["min", "max", "rms"],
+        "levels": [
+            {"level": i, "windows": len(level), "window_seconds": window_seconds * LEVEL_FACTOR ** i}
+            for i, level in enumerate(levels)
+        ],
+    }
+    with open(os.path.join(directory, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+class WaveformPyramid:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    @property
+    def levels(self):
+        return self.meta["levels"]
+
+    def level_for(self, start, end, max_points):
+        """Finest level showing [start, end) in at most max_points windows"""
+        for info in self.levels:
+            if (end - start) / info["window_seconds"] <= max_points:
+                return info["level"]
+        return self.levels[-1]["level"]
+
+    def read(self, level, start, end):
+        """
+        Read a tile of one level.
+
+        Returns:
+            (first_window, int16 array of shape [windows, 3])
+        """
+        info = self.levels[level]
+        window_seconds = info["window_seconds"]
+        first = max(0, int(start / window_seconds))
+        last = min(info["windows"], int(np.ceil(end / window_seconds)))
+        if last <= first:
+            return first, np.zeros((0, 3), dtype="<i2")
+        data = np.memmap(os.path.join(self.directory, f"level_{level}.bin"),
+                         dtype="<i2", mode="r", shape=(info["windows"], 3))
+        return first, np.array(data[first:last])